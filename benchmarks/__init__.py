@@ -0,0 +1,5 @@
+"""
+Brushfire benchmarks. Run the whole suite against a local stub solr with:
+
+    python -m benchmarks.run --output results.json
+"""
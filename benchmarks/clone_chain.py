@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Times queryset builder chains (filter/narrow/order_by/facet...) of increasing
+length. With copy-on-write cloning the cost per step stays flat instead of
+growing with the size of the query.
+
+    python benchmarks/clone_chain.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import env
+env.setup()
+
+from benchmarks.models import Person
+from benchmarks.timer import measure
+
+def chain(steps):
+    qs = Person.objects.all()
+    for i in range(steps):
+        if i % 4 == 0:
+            qs = qs.filter(name='name%d' % i)
+        elif i % 4 == 1:
+            qs = qs.narrow(location='loc%d' % i)
+        elif i % 4 == 2:
+            qs = qs.exclude(age=i)
+        else:
+            qs = qs.order_by('-age').facet('location')
+    return qs
+
+def run(min_time=0.2):
+    results = {}
+    for steps in (10, 25, 50):
+        t = measure(lambda: chain(steps), min_time)
+        results['%d_steps' % steps] = {'seconds': t, 'per_step': t / steps}
+    return results
+
+def main():
+    for name, r in sorted(run().items(), key=lambda x: int(x[0].split('_')[0])):
+        print "%9s: %8.1f us/chain, %6.1f us/step" % (
+                name, r['seconds'] * 1e6, r['per_step'] * 1e6)
+
+if __name__ == '__main__':
+    main()
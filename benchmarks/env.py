@@ -0,0 +1,23 @@
+"""
+Django/brushfire settings for the benchmarks. setup() must be called before
+brushfire (or benchmarks.models) is imported.
+"""
+from django.conf import settings
+
+DEFAULT_HOST = 'http://localhost:8983/solr'
+
+def setup(host=DEFAULT_HOST, fetch_rows=1000, codec='json'):
+    if settings.configured:
+        return
+    settings.configure(
+        INSTALLED_APPS=[],
+        BRUSHFIRE={
+            'host': host,
+            'cores': {'query': 'bench'},
+            'handlers': {'default': 'select'},
+            'query': {'fetch_rows': fetch_rows},
+            'codec': {'name': codec},
+        },
+    )
+    import django
+    django.setup()
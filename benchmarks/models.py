@@ -0,0 +1,13 @@
+from brushfire.core import models as bfm
+
+class Person(bfm.BrushfireModel):
+    ssn = bfm.CharField(primary_key=True)
+    name = bfm.CharField()
+    age = bfm.IntegerField()
+    location = bfm.CharField()
+    weight_lbs = bfm.FloatField()
+    active = bfm.BooleanField()
+    bio = bfm.TextField()
+
+    class Meta:
+        app_label = 'benchmarks'
@@ -0,0 +1,86 @@
+"""
+Times each phase of a queryset evaluation separately against a StubSolr:
+
+    build      filter()/exclude()/... chain plus q, fq and params compilation
+    url        Solr._url() parameter encoding
+    transport  the HTTP round trip, body read but not parsed
+    decode     the configured codec's decode() of the response body
+    hydrate    field decoding and model instantiation
+    end_to_end list(qs[:rows]) with the query cache bypassed
+"""
+from brushfire.core.driver import SQ
+from brushfire.core.hydrate import get_hydrator
+from brushfire.core.settings import configuration as conf
+from brushfire import functions as f
+
+from benchmarks.models import Person
+from benchmarks.timer import measure, rate
+
+def simple():
+    return Person.objects.filter(name='person 1')
+
+def compound():
+    return Person.objects.filter(SQ(age__gte=30) | SQ(location__in=['location1', 'location2']),
+            active=True).exclude(name='person 2', age=3).narrow(location='location1')\
+                    .order_by('-age', 'name').facet('location')
+
+def function_query():
+    return Person.objects.filter(age__range=(20, 40))\
+            .annotate(bmi=f.mul(f.div('weight_lbs', f.pow('age', 2)), 703))\
+            .frange(l=25, bmi=f.mul(f.div('weight_lbs', f.pow('age', 2)), 703))
+
+QUERYSETS = (
+    ('simple', simple),
+    ('compound', compound),
+    ('function_query', function_query),
+)
+
+def build(make):
+    q = make().query
+    return q.get_querystring(), q.get_querystring(property='fq'), q.get_query_params()
+
+def url_params(solr, qs, rows):
+    """
+    The parameter dict Solr.search() hands to _url() for qs
+    """
+    q = qs.query
+    params = {
+        'q': q.get_querystring(),
+        'fq': q.get_querystring(property='fq'),
+        'wt': solr.codec.wt,
+        'fl': ','.join(q.fields),
+        'rows': rows,
+        'start': 0,
+        'sort': solr.format_sort(q.ordering),
+        'frange': q.frange,
+        'annotations': q.annotations,
+    }
+    if q.facets:
+        params.update({'facet': 'on', 'facet.fields': q.facets})
+    return params
+
+def run(rows=100, min_time=0.2):
+    solr = conf.solr_connection
+    path = '%s/%s' % (solr.default_core, solr.query_handler)
+    results = {}
+    for name, make in QUERYSETS:
+        qs = make()
+        params = url_params(solr, qs, rows)
+        url = solr._url(path, dict(params))
+        content = solr._request(url).content
+        docs = solr.codec.decode(content)['response']['docs']
+        hydrator = get_hydrator(Person, qs.query.fields, qs.allow_non_model_fields)
+
+        results[name] = {
+            'build': rate(measure(lambda: build(make), min_time)),
+            'url': rate(measure(lambda: solr._url(path, dict(params)), min_time)),
+            'transport': dict(rate(measure(lambda: solr._request(url).content, min_time)),
+                    bytes=len(content)),
+            'decode': rate(measure(lambda: solr.codec.decode(content), min_time), len(docs)),
+            # decoders are idempotent, so re-decoding the same docs is fair
+            'hydrate': rate(measure(lambda: [hydrator(d) for d in hydrator.decode(docs)],
+                    min_time), len(docs)),
+            'end_to_end': rate(measure(lambda: list(make().nocache()[:rows]), min_time),
+                    len(docs)),
+        }
+    return results
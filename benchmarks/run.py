@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Runs the benchmark suite against a local StubSolr and writes the results as
+JSON, optionally comparing them with an earlier run:
+
+    python -m benchmarks.run --docs 10000 --rows 100 --output new.json --compare old.json
+"""
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import env
+from benchmarks.stubserver import StubSolr
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results, prefix=''):
+    """
+    {'a': {'b': {'seconds': 1}}} -> {'a.b': 1}
+    """
+    out = {}
+    for k, v in results.items():
+        if isinstance(v, dict):
+            if 'seconds' in v:
+                out[prefix + k] = v['seconds']
+            else:
+                out.update(flatten(v, prefix + k + '.'))
+    return out
+
+def compare(new, old):
+    new, old = flatten(new['results']), flatten(old['results'])
+    print "%-40s %12s %12s %8s" % ('benchmark', 'old (us)', 'new (us)', 'change')
+    for name in sorted(set(new) & set(old)):
+        change = (new[name] - old[name]) / old[name] * 100 if old[name] else 0
+        print "%-40s %12.1f %12.1f %+7.1f%%" % (name, old[name] * 1e6, new[name] * 1e6, change)
+
+def main():
+    parser = OptionParser(usage="python -m benchmarks.run [options]")
+    parser.add_option('--docs', type='int', default=10000,
+            help="documents served by the stub solr [%default]")
+    parser.add_option('--doc-size', type='int', default=200,
+            help="size of each document's text field in bytes [%default]")
+    parser.add_option('--rows', type='int', default=100,
+            help="rows per request [%default]")
+    parser.add_option('--min-time', type='float', default=0.2,
+            help="minimum seconds per measurement [%default]")
+    parser.add_option('--codec', default='json',
+            help="response codec to request and decode with, json or javabin [%default]")
+    parser.add_option('--output', help="write the results to this JSON file")
+    parser.add_option('--compare', help="compare with the results in this JSON file")
+    options, args = parser.parse_args()
+
+    with StubSolr(options.docs, options.doc_size) as stub:
+        env.setup(host=stub.url, codec=options.codec)
+        from benchmarks import clone_chain, phases
+        results = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'python': platform.python_version(),
+                'options': options.__dict__,
+            },
+            'results': {
+                'phases': phases.run(options.rows, options.min_time),
+                'clone_chain': clone_chain.run(options.min_time),
+            },
+        }
+        # drop the keep-alive connections before the server goes away
+        from brushfire.core.settings import configuration as conf
+        conf.solr_connection.pool.close()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output)
+    else:
+        print output
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
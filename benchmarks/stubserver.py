@@ -0,0 +1,199 @@
+"""
+A local HTTP server answering solr select requests with canned JSON (or
+javabin, for wt=javabin), so the client side can be benchmarked without a
+real solr.
+
+    >>> with StubSolr(num_docs=10000, doc_size=200) as solr:
+    ...     print solr.url   # http://127.0.0.1:<port>/solr
+
+Documents are generated once, up front; each request only slices them and
+serializes the page, which is the part a real solr would also have to do.
+"""
+import json
+import struct
+import threading
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qsl
+
+def make_docs(num_docs, doc_size):
+    """
+    Deterministic documents matching benchmarks.models.Person, with a `bio`
+    of doc_size characters
+    """
+    filler = ('lorem ipsum dolor sit amet ' * (doc_size // 27 + 1))[:doc_size]
+    return [{
+        'ssn': '%09d' % i,
+        'name': 'person %d' % i,
+        'age': i % 90,
+        'location': 'location%d' % (i % 50),
+        'weight_lbs': 100 + (i % 200) * 0.5,
+        'active': i % 3 != 0,
+        'bio': filler,
+        'score': 1.0,
+    } for i in xrange(num_docs)]
+
+class JavabinWriter(object):
+    """
+    Just enough of solr's JavaBinCodec to write a select response: field
+    names and map keys as extern strings, the result as a SolrDocumentList
+    """
+    def __init__(self):
+        self.out = []
+        self.strings = {}
+
+    def dumps(self, body):
+        self.out.append(chr(2)) # version
+        self.map(body)
+        return ''.join(self.out)
+
+    def tag(self, kind, size):
+        if size < 0x1f:
+            self.out.append(chr(kind << 5 | size))
+        else:
+            self.out.append(chr(kind << 5 | 0x1f))
+            self.vint(size - 0x1f)
+
+    def vint(self, value):
+        while value & ~0x7f:
+            self.out.append(chr(value & 0x7f | 0x80))
+            value >>= 7
+        self.out.append(chr(value))
+
+    def extern(self, s):
+        index = self.strings.get(s)
+        if index:
+            self.tag(7, index)
+        else:
+            self.tag(7, 0)
+            self.value(s)
+            self.strings[s] = len(self.strings) + 1
+
+    def map(self, d):
+        self.tag(5, len(d))
+        for k, v in d.items():
+            self.extern(k)
+            self.value(v)
+
+    def documents(self, result):
+        self.out.append(chr(12))
+        self.value([result['numFound'], result['start'], None])
+        self.tag(4, len(result['docs']))
+        for doc in result['docs']:
+            self.out.append(chr(11))
+            self.map(doc)
+
+    def value(self, v):
+        if v is None:
+            self.out.append(chr(0))
+        elif v is True:
+            self.out.append(chr(1))
+        elif v is False:
+            self.out.append(chr(2))
+        elif isinstance(v, (int, long)):
+            if -2 ** 31 <= v < 2 ** 31:
+                self.out.append(chr(6) + struct.pack('>i', v))
+            else:
+                self.out.append(chr(7) + struct.pack('>q', v))
+        elif isinstance(v, float):
+            self.out.append(chr(5) + struct.pack('>d', v))
+        elif isinstance(v, basestring):
+            if isinstance(v, unicode):
+                v = v.encode('utf-8')
+            self.tag(1, len(v))
+            self.out.append(v)
+        elif isinstance(v, (list, tuple)):
+            self.tag(4, len(v))
+            for item in v:
+                self.value(item)
+        elif 'docs' in v and 'numFound' in v:
+            self.documents(v)
+        else:
+            self.map(v)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like solr's jetty
+    # send headers and body in one go, or delayed ACKs skew the transport numbers
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _params(self):
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            params.update(parse_qsl(self.rfile.read(length)))
+        return url.path, params
+
+    def do_GET(self):
+        path, params = self._params()
+        self.server.requests += 1
+        docs = self.server.docs
+        start = int(params.get('start', 0))
+        rows = int(params.get('rows', 10))
+        body = {
+            'responseHeader': {'status': 0, 'QTime': 1, 'params': params},
+            'response': {
+                'numFound': len(docs),
+                'start': start,
+                'docs': docs[start:start + rows],
+            },
+        }
+        if params.get('facet') == 'on':
+            body['facet_counts'] = {'facet_fields': {
+                params.get('facet.field', 'location'): sum(
+                    [['location%d' % i, len(docs) // 50] for i in range(50)], []),
+            }}
+        if params.get('wt') == 'javabin':
+            data = JavabinWriter().dumps(body)
+            content_type = 'application/octet-stream'
+        else:
+            data = json.dumps(body)
+            content_type = 'application/json; charset=UTF-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_POST = do_GET
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class StubSolr(object):
+    def __init__(self, num_docs=1000, doc_size=200, host='127.0.0.1', port=0):
+        self.server = _Server((host, port), StubHandler)
+        self.server.docs = make_docs(num_docs, doc_size)
+        self.server.requests = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return 'http://%s:%d/solr' % (host, port)
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
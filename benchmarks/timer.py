@@ -0,0 +1,24 @@
+import timeit
+
+def measure(func, min_time=0.2, repeat=3):
+    """
+    Returns the best time per call of func, in seconds. Each of the `repeat`
+    runs makes as many calls as it takes to last at least min_time.
+    """
+    number = 1
+    while True:
+        t = timeit.timeit(func, number=number)
+        if t >= min_time:
+            break
+        number = number * 10 if t == 0 else number * max(2, int(min_time / t) + 1)
+    times = [t] + timeit.repeat(func, number=number, repeat=repeat - 1)
+    return min(times) / number
+
+def rate(seconds, items=1):
+    """
+    Result record for one measurement: seconds per call and items per second
+    """
+    return {
+        'seconds': seconds,
+        'per_sec': items / seconds if seconds else None,
+    }
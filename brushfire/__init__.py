@@ -1,14 +1,14 @@
 from django.conf import settings
-from django.utils.importlib import import_module
 
 from brushfire.core.driver import Solr
 from brushfire.core.settings import configuration as conf
 from brushfire.core.query import *
 from brushfire.core import models
+from brushfire.utils import import_class
 
 driver = conf.get('driver', False, None)
 if driver:
-    driver = import_module(driver)
+    driver = import_class(driver)
 else:
     driver = Solr
 
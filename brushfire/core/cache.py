@@ -0,0 +1,146 @@
+import os
+import hashlib
+import logging
+import threading
+import cPickle as pickle
+from time import time
+from urllib import urlencode
+
+logger = logging.getLogger('brushfire.core.cache')
+
+class QueryCache(object):
+    """
+    Base class for Solr response caches.
+
+    Responses are keyed on a canonical (sorted) form of the final request
+    parameters, so two querysets that build the same request in a different
+    order share an entry. Subclasses only need to implement _get(), _set() and
+    optionally _clear().
+    """
+    def __init__(self, timeout=300, handlers=None, max_entries=1000, **kwargs):
+        self.timeout = timeout
+        self.handler_timeouts = handlers or {}
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def timeout_for(self, handler):
+        """
+        Returns the ttl for responses from `handler`. A ttl of 0 disables
+        caching for that handler.
+        """
+        return self.handler_timeouts.get(handler.strip('/'), self.timeout)
+
+    def make_key(self, url):
+        params = sorted(url.query_params)
+        return hashlib.sha1(url.urlpart + '?' + urlencode(params)).hexdigest()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, handler):
+        timeout = self.timeout_for(handler)
+        if timeout:
+            self._set(key, value, timeout)
+
+    def clear(self):
+        self._clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, timeout):
+        raise NotImplementedError
+
+    def _clear(self):
+        pass
+
+class FileQueryCache(QueryCache):
+    def __init__(self, path, **kwargs):
+        super(FileQueryCache, self).__init__(**kwargs)
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + '.solrcache')
+
+    def _get(self, key):
+        fname = self._filename(key)
+        try:
+            with open(fname, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time():
+            self._delete(fname)
+            return None
+        return value
+
+    def _set(self, key, value, timeout):
+        self._cull()
+        fname = self._filename(key)
+        tmp = "%s.%d.%d" % (fname, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump((time() + timeout, value), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, fname)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to write cache file %s: %s", fname, e)
+            self._delete(tmp)
+
+    def _entries(self):
+        return [os.path.join(self.path, x) for x in os.listdir(self.path)
+                if x.endswith('.solrcache')]
+
+    def _cull(self):
+        """
+        Drop the oldest third of the entries once max_entries is reached
+        """
+        entries = self._entries()
+        if len(entries) < self.max_entries:
+            return
+        entries.sort(key=lambda x: os.path.getmtime(x) if os.path.exists(x) else 0)
+        for fname in entries[:max(len(entries) / 3, 1)]:
+            self._delete(fname)
+
+    def _delete(self, fname):
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+
+    def _clear(self):
+        for fname in self._entries():
+            self._delete(fname)
+
+class DjangoQueryCache(QueryCache):
+    """
+    Stores responses in a django cache backend. Size bounds are left to the
+    backend itself (see the backend's MAX_ENTRIES option).
+    """
+    def __init__(self, cache, prefix='solrcache', **kwargs):
+        super(DjangoQueryCache, self).__init__(**kwargs)
+        self.cache = cache
+        self.prefix = prefix
+
+    def _key(self, key):
+        return "%s:%s" % (self.prefix, key)
+
+    def _get(self, key):
+        return self.cache.get(self._key(key))
+
+    def _set(self, key, value, timeout):
+        self.cache.set(self._key(key), value, timeout)
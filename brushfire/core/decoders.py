@@ -0,0 +1,39 @@
+import re
+import datetime
+
+from django.conf import settings
+
+from brushfire.utils import utc
+
+DATE_RE = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,3}))?Z$')
+DATE_CACHE_MAX = 10000
+
+_date_cache = {}
+
+def decode_bool(value):
+    if isinstance(value, basestring):
+        return value == 'true'
+    return bool(value)
+
+def decode_date(value):
+    """
+    Parse a Solr date string into a datetime (aware when USE_TZ is on).
+    Results are memoized since timestamps tend to repeat across a result set.
+    """
+    try:
+        return _date_cache[value]
+    except KeyError:
+        pass
+    if not isinstance(value, basestring):
+        return value
+    m = DATE_RE.match(value)
+    if m is None:
+        return value
+    y, mo, d, h, mi, s, ms = m.groups()
+    dt = datetime.datetime(int(y), int(mo), int(d), int(h), int(mi), int(s),
+            int(ms.ljust(3, '0')) * 1000 if ms else 0,
+            utc if getattr(settings, 'USE_TZ', False) else None)
+    if len(_date_cache) >= DATE_CACHE_MAX:
+        _date_cache.clear()
+    _date_cache[value] = dt
+    return dt
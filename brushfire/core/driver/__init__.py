@@ -7,6 +7,7 @@ import six
 from django.utils.tree import Node
 from django.db.models import Q
 from django.utils.importlib import import_module
+from django.utils.encoding import force_text
 try:
     from django.db.models.sql.constants import LOOKUP_SEP
 except ImportError:
@@ -15,8 +16,9 @@ except ImportError:
 from brushfire.core.driver.solr import *
 from brushfire.core.settings import configuration as conf
 from brushfire.utils import smart_quote_string
-from brushfire.core.types import FRange, GroupedFRange
+from brushfire.core.types import FRange, GroupedFRange, P
 from brushfire.core.exceptions import BrushfireException
+from brushfire.core.timing import QueryTimings
 
 QUERY_TERMS = set([
     'exact', 'contains', 'gt', 'gte', 'lt', 'lte', 'in',
@@ -24,6 +26,35 @@ QUERY_TERMS = set([
 
 logger = logging.getLogger('brushfire.driver.query')
 
+# Compiled query strings shared between structurally identical subtrees,
+# keyed on (fragment callback, subtree key)
+FRAGMENT_CACHE_MAX = 10000
+_fragment_cache = {}
+
+def _value_key(value):
+    # Objects without a meaningful repr are keyed on themselves; their default
+    # repr contains an id() that could be reused once they are collected.
+    if type(value).__repr__ is object.__repr__:
+        return value
+    return repr(value)
+
+class SearchText(unicode):
+    """
+    default_search() text kept as a clause once filters are added; it is
+    already lucene syntax, so it is sent as-is instead of being quoted
+    """
+    pass
+
+def _find_placeholders(node, names):
+    for child in node.children:
+        if isinstance(child, SearchNode):
+            _find_placeholders(child, names)
+        elif not isinstance(child, six.string_types):
+            value = child[1]
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+            names.update(v.name for v in value if isinstance(v, P))
+
 class SearchNode(Node):
     AND = 'AND'
     OR = 'OR'
@@ -54,6 +85,25 @@ class SearchNode(Node):
         self.subtree_parents = []
         self.negated = negated
         self._optimized = True
+        self._invalidate()
+
+    def shallow_copy(self):
+        """
+        Copy this node but not its children, which are shared with the copy
+        """
+        obj = self._new_instance(self.children, self.connector, self.negated)
+        obj.subtree_parents = self.subtree_parents[:]
+        obj._optimized = self._optimized
+        obj._compiled = dict(self._compiled)
+        obj._key = self._key
+        return obj
+
+    def _invalidate(self):
+        """
+        Forget compiled query strings; called whenever the tree changes
+        """
+        self._compiled = {}
+        self._key = None
 
     # We need this because of django.db.models.query_utils.Q. Q. __init__() is
     # problematic, but it is a natural Node subclass in all other respects.
@@ -86,6 +136,8 @@ class SearchNode(Node):
         obj.__class__ = self.__class__
         obj.children = copy.deepcopy(self.children, memodict)
         obj.subtree_parents = copy.deepcopy(self.subtree_parents, memodict)
+        obj._compiled = dict(self._compiled)
+        obj._key = self._key
         return obj
 
     def __len__(self):
@@ -119,6 +171,7 @@ class SearchNode(Node):
         if node in self.children and conn_type == self.connector:
             return
         self._optimized = False
+        self._invalidate()
         if len(self.children) < 2:
             self.connector = conn_type
         if self.connector == conn_type:
@@ -146,6 +199,7 @@ class SearchNode(Node):
         self.children = [self._new_instance(self.children, self.connector,
                 not self.negated)]
         self.connector = self.default
+        self._invalidate()
 
     def start_subtree(self, conn_type):
         """
@@ -153,6 +207,7 @@ class SearchNode(Node):
         current node. The conn_type specifies how the sub-tree is joined to the
         existing children.
         """
+        self._invalidate()
         if len(self.children) == 1:
             self.connector = conn_type
         elif self.connector != conn_type:
@@ -174,6 +229,7 @@ class SearchNode(Node):
         This puts the current state into a node of the parent tree and returns
         the current instances state to be the parent.
         """
+        self._invalidate()
         obj = self.subtree_parents.pop()
         node = self.__class__(self.children, self.connector)
         self.connector = obj.connector
@@ -181,81 +237,129 @@ class SearchNode(Node):
         self.children = obj.children
         self.children.append(node)
         
-    def optimize(self):
+    def optimize(self, force=False):
         """
         This is a basic query optimizer. It's only current ability is to detect
         multiple filters or excludes acting on the same field at the same level
         in the node tree and combine them into an __in query. 
         eg. .exclude(foo='bar').exclude(foo='baz').exclude(foo='bak') becomes
             .exclude(foo__in=('bar', 'baz', 'bak')
+
+        Returns the optimized tree as a new node. This node and its subtrees
+        are never changed, since clones of a query share them and may be
+        compiled from several threads at once (see SolrQuery._own()).
         """
-        if self._optimized:
-            return
-        new_fields = {}
+        if self._optimized and not force:
+            return self
+        children = []
         for c in self.children:
-            if not isinstance(c, SearchNode):
+            if isinstance(c, SearchNode) and len(c.children) != 1:
+                c = c.optimize(force=True)
+            children.append(c)
+
+        new_fields = {}
+        for c in children:
+            if not isinstance(c, SearchNode) or len(c.children) != 1:
                 continue
-            if len(c.children) == 1:
-                k,v = c.children[0]
-                if k.find("__") == -1:
-                    new_field = k+"__in"
-                    if new_fields.get(new_field, None) is None:
-                        new_fields[new_field] = {
-                            "negated": c.negated, 
-                            "values": [v],
-                            "maybe_remove": [c],
-                        }
-                    elif new_fields[new_field]['negated'] == c.negated:
-                        new_fields[new_field]["values"].append(v)
-                        new_fields[new_field]["maybe_remove"].append(c)
-                    else:
-                        """
-                        This really shouldn't happen because you shouldn't be
-                        making a query that says foo is xxx and foo is not yyy,
-                        but just in case i'm crazy, we'll support it.
-                        """
-                        new_fields[new_field] = {
-                            "negated": c.negated, 
-                            "values": [v],
-                            "maybe_remove": [c],
-                        }
-                elif k.endswith("__in"):
-                    if new_fields.get(k, None) is None:
-                       new_fields[k] = {
-                           "negated": c.negated, 
-                           "values": list(v),
-                           "maybe_remove": [c],
-                       }
-                    elif new_fields[k]['negated'] == c.negated:
-                        new_fields[k]['values'].extend(v)
-                        new_fields[k]['maybe_remove'].append(c)
-                    else:
-                       """
-                       see note for same case above.
-                       """
-                       new_fields[k] = {
-                           "negated": c.negated, 
-                           "values": list(v),
-                           "maybe_remove": [c],
-                       }
-                    
-            else:
-                c._optimized = False
-                c.optimize()
-        
+            k,v = c.children[0]
+            if isinstance(v, P):
+                # placeholders are rendered on their own, not merged
+                continue
+            if k.find("__") == -1:
+                new_field = k+"__in"
+                if new_fields.get(new_field, None) is None:
+                    new_fields[new_field] = {
+                        "negated": c.negated, 
+                        "values": [v],
+                        "maybe_remove": [c],
+                    }
+                elif new_fields[new_field]['negated'] == c.negated:
+                    new_fields[new_field]["values"].append(v)
+                    new_fields[new_field]["maybe_remove"].append(c)
+                else:
+                    """
+                    This really shouldn't happen because you shouldn't be
+                    making a query that says foo is xxx and foo is not yyy,
+                    but just in case i'm crazy, we'll support it.
+                    """
+                    new_fields[new_field] = {
+                        "negated": c.negated, 
+                        "values": [v],
+                        "maybe_remove": [c],
+                    }
+            elif k.endswith("__in"):
+                if new_fields.get(k, None) is None:
+                   new_fields[k] = {
+                       "negated": c.negated, 
+                       "values": list(v),
+                       "maybe_remove": [c],
+                   }
+                elif new_fields[k]['negated'] == c.negated:
+                    new_fields[k]['values'].extend(v)
+                    new_fields[k]['maybe_remove'].append(c)
+                else:
+                   """
+                   see note for same case above.
+                   """
+                   new_fields[k] = {
+                       "negated": c.negated, 
+                       "values": list(v),
+                       "maybe_remove": [c],
+                   }
+
+        node = self._new_instance(children, self.connector, self.negated)
         for k,v in new_fields.items():
             if v['maybe_remove'] > 1:
                 for c in v['maybe_remove']:
-                    self.children.remove(c)
+                    node.children.remove(c)
                 if v['negated']:
-                    self.add(~SQ(**{k:v['values']}), self.connector)
+                    node.add(~SQ(**{k:v['values']}), node.connector)
                 else:
-                    self.add(SQ(**{k:v['values']}), self.connector)
-        
-        self._optimized = True
+                    node.add(SQ(**{k:v['values']}), node.connector)
+
+        node._optimized = True
+        return node
+
+    def cache_key(self):
+        """
+        A hashable description of this subtree, used to share compiled query
+        strings between identical subtrees
+        """
+        if self._key is None:
+            children = []
+            for child in self.children:
+                if isinstance(child, SearchNode):
+                    children.append(child.cache_key())
+                elif isinstance(child, SearchText):
+                    children.append(('SearchText', child))
+                elif isinstance(child, six.string_types):
+                    children.append(child)
+                else:
+                    children.append((child[0], _value_key(child[1])))
+            self._key = (self.connector, self.negated, tuple(children))
+        return self._key
 
     def as_query_string(self, query_fragment_callback):
-        self.optimize()
+        """
+        Compile the tree into a query string. The result is memoized on the
+        node (and shared between identical subtrees) until the tree changes.
+        """
+        func = getattr(query_fragment_callback, '__func__', query_fragment_callback)
+        try:
+            return self._compiled[func]
+        except KeyError:
+            pass
+        key = (func, self.cache_key())
+        query_string = _fragment_cache.get(key)
+        if query_string is None:
+            query_string = self.optimize()._compile(query_fragment_callback)
+            if len(_fragment_cache) >= FRAGMENT_CACHE_MAX:
+                _fragment_cache.clear()
+            _fragment_cache[key] = query_string
+        self._compiled[func] = query_string
+        return query_string
+
+    def _compile(self, query_fragment_callback):
         result = []
         for child in self.children:
             if hasattr(child, 'as_query_string'):
@@ -293,6 +397,9 @@ class SearchNode(Node):
         for c in self.children:
             if isinstance(c, SearchNode):
                 children.append(c._serialize())
+            elif isinstance(c, SearchText):
+                # keep it from coming back as a value to be quoted
+                children.append({'search_text': c})
             else:
                 children.append(c)
         s['children'] = children
@@ -306,7 +413,9 @@ class SearchNode(Node):
         s.connector = data['connector']
         s.negated = data['negated']
         for c in data['children']:
-            if isinstance(c, dict):
+            if isinstance(c, dict) and 'search_text' in c:
+                s.children.append(SearchText(c['search_text']))
+            elif isinstance(c, dict):
                 s.children.append(SearchNode._from_serial(c))
             else:
                 s.children.append(c)
@@ -316,6 +425,11 @@ class SQ(Q, SearchNode):
     pass
 
 class SolrQuery(object):
+    # Containers that clones share until one side writes to them
+    COPY_ON_WRITE = ('where', 'fq', 'ordering', 'facets', 'stats',
+            'stats_facets', 'fields', 'extra_params', 'annotations', 'frange',
+            'json_facets')
+
     def __init__(self, model=None):
         self.model = model
         self.low_mark = 0
@@ -330,7 +444,36 @@ class SolrQuery(object):
         self.extra_params = {}
         self.annotations = {}
         self.frange = []
+        self.json_facets = {}
+        self.group = None
+        self.collapse = None
         self.handler = conf.get('handlers.default')
+        self.use_cache = True
+        self.streaming = False
+        self.fetch_rows = conf.get('query.fetch_rows', False, 1000)
+        self.time_allowed = conf.get('query.time_allowed', False)
+        self.compiled = None
+        self.bindings = {}
+        self._shared = set()
+
+    def _own(self, name):
+        """
+        Returns attribute `name`, first copying it if it is still shared with
+        another SolrQuery. SearchNodes only have their top level copied; the
+        subtrees below are never modified in place (optimize() builds a new
+        tree) so they stay shared.
+        """
+        value = getattr(self, name)
+        if name in self._shared:
+            self._shared.discard(name)
+            if isinstance(value, SearchNode):
+                value = value.shallow_copy()
+            elif isinstance(value, dict):
+                value = dict(value)
+            elif isinstance(value, list):
+                value = list(value)
+            setattr(self, name, value)
+        return value
 
     def _serialize(self):
         return {
@@ -346,7 +489,14 @@ class SolrQuery(object):
             'extra_params': self.extra_params,
             'annotations': self.annotations,
             'frange': [x._serialize() for x in self.frange],
+            'json_facets': self.json_facets,
+            'group': self.group,
+            'collapse': self.collapse,
             'handler': self.handler,
+            'use_cache': self.use_cache,
+            'streaming': self.streaming,
+            'time_allowed': self.time_allowed,
+            'bindings': self.bindings,
         }
 
     @staticmethod
@@ -380,17 +530,33 @@ class SolrQuery(object):
             self.fields = [x.name for x in self.model._meta.fields] + ['score']
             
     def add_fields(self, *fields):
-        self.fields += list(fields)
+        self._own('fields').extend(fields)
             
     def set_handler(self, handler):
         self.handler = handler
 
+    def set_use_cache(self, use_cache):
+        self.use_cache = use_cache
+
+    def set_streaming(self, streaming):
+        self.streaming = streaming
+
+    def set_time_allowed(self, ms):
+        self.time_allowed = ms
+
+    def set_group(self, field, limit=1, sort=None):
+        self.group = {'field': field, 'limit': limit, 'sort': sort}
+
+    def set_collapse(self, field, sort=None, expand=None, null_policy=None):
+        self.collapse = {'field': field, 'sort': sort, 'expand': expand,
+                'null_policy': null_policy}
+
     def clear_ordering(self):
         self.ordering = []
         return self
 
     def add_ordering(self, *order):
-        self.ordering += order
+        self._own('ordering').extend(order)
         return self
 
     def clear_annotations(self):
@@ -398,8 +564,7 @@ class SolrQuery(object):
         return self
 
     def add_annotations(self, **kwargs):
-        for k,v in kwargs.items():
-            self.annotations[k] = v
+        self._own('annotations').update(kwargs)
         return self
     
     def clear_frange(self):
@@ -407,13 +572,13 @@ class SolrQuery(object):
         return self
 
     def add_frange(self, l, u, func):
-        self.frange.append(FRange(l=l, u=u, func=func))
+        self._own('frange').append(FRange(l=l, u=u, func=func))
         return self
     
     def add_frange_group(self, frs):
         if not isinstance(frs, GroupedFRange):
             raise BrushfireException("Expected type(GroupedFRange) got type(%s)" % type(frs))
-        self.frange.append(frs)
+        self._own('frange').append(frs)
         return self
 
     def clear_facets(self):
@@ -421,7 +586,7 @@ class SolrQuery(object):
         return self
 
     def add_facets(self, *fields):
-        self.facets += fields
+        self._own('facets').extend(fields)
         return self
 
     def clear_stats(self):
@@ -429,7 +594,7 @@ class SolrQuery(object):
         return self
 
     def add_stats(self, *fields):
-        self.stats += fields
+        self._own('stats').extend(fields)
         return self
 
     def clear_stats_facets(self):
@@ -437,7 +602,19 @@ class SolrQuery(object):
         return self
 
     def add_stats_facets(self, *fields):
-        self.stats_facets += fields
+        self._own('stats_facets').extend(fields)
+        return self
+
+    def clear_json_facets(self):
+        self.json_facets = {}
+        return self
+
+    def add_json_facets(self, facets):
+        """
+        facets is a {name: facet} dict in json.facet form (see
+        brushfire.facets.as_json)
+        """
+        self._own('json_facets').update(facets)
         return self
 
     def clear_extra_params(self):
@@ -445,23 +622,17 @@ class SolrQuery(object):
         return self
 
     def add_extra_params(self, d):
-        self.extra_params.update(d)
+        self._own('extra_params').update(d)
 
     def clone(self):
-        q = SolrQuery(self.model)
-        q.low_mark = self.low_mark
-        q.high_mark = self.high_mark
-        q.where = copy.deepcopy(self.where)
-        q.fq = copy.deepcopy(self.fq)
-        q.ordering = self.ordering[:]
-        q.facets = self.facets[:]
-        q.stats = self.stats[:]
-        q.stats_facets = self.stats_facets[:]
-        q.fields = self.fields[:]
-        q.extra_params = copy.deepcopy(self.extra_params)
-        q.annotations = copy.deepcopy(self.annotations)
-        q.frange = self.frange[:]
-        q.handler = self.handler
+        """
+        O(1) copy: both queries share their containers and copy one only
+        when they are about to change it (see _own())
+        """
+        q = self.__class__.__new__(self.__class__)
+        q.__dict__.update(self.__dict__)
+        self._shared = set(self.COPY_ON_WRITE)
+        q._shared = set(self.COPY_ON_WRITE)
         return q
 
     def set_limits(self, low=None, high=None):
@@ -476,12 +647,6 @@ class SolrQuery(object):
         """
         logger.debug("Called set_limits(%r, %r)", low, high)
 
-        # XXX:
-        # This is a shitty hack. Setting high=0 causes an infinite loop, but I
-        # don't know why. You _should_ be able to use &rows=0 in solr to get
-        # back metadata about the result set (like result count)
-        if high < 1:
-            high = 1
         if high is not None:
             if self.high_mark is not None:
                 self.high_mark = min(self.high_mark, self.low_mark + high)
@@ -494,9 +659,33 @@ class SolrQuery(object):
                 self.low_mark = self.low_mark + low
 
     def default_search(self, q):
+        self.compiled = None
         self.where = q
+        # q belongs to the caller, don't modify it in place
+        self._shared.add('where')
+
+    def compile(self):
+        """
+        Freeze the q and fq strings so later runs don't look at the trees at
+        all. Returns the names of the P() placeholders they contain.
+        """
+        self.compiled = None
+        self.compiled = {
+            'where': self.get_querystring(),
+            'fq': self.get_querystring(property='fq'),
+        }
+        names = set()
+        for node in (self.where, self.fq):
+            if isinstance(node, SearchNode):
+                _find_placeholders(node, names)
+        return names
+
+    def bind(self, values):
+        self.bindings = dict((P(k).param, P.encode(v)) for k, v in values.items())
 
     def get_querystring(self, property='where'):
+        if self.compiled is not None:
+            return self.compiled[property]
         where = getattr(self, property)
         if isinstance(where, SearchNode):
             qs = where.as_query_string(self.build_query_fragment)
@@ -528,33 +717,98 @@ class SolrQuery(object):
             'stats_facets':self.stats_facets,
             'annotations':self.annotations,
             'frange':self.frange,
+            'json_facet':json.dumps(self.json_facets) if self.json_facets else None,
+            'group':self.group,
+            'collapse':self.collapse,
             'handler':self.handler,
+            'use_cache':self.use_cache,
+            'stream':self.streaming,
+            'timeAllowed':self.time_allowed,
         }
         p.update(self.extra_params)
+        p.update(self.bindings)
         return p
 
     def start(self):
         return self.low_mark or 0
 
     def rows(self):
-        if self.high_mark:
-            minrows = self.high_mark
-        # If you only use narrow() and no filter(), this will set the rows to
-        # 10, which most likely is not what we want
-        #elif self.get_querystring() == "*:*":
-        #    minrows = 10
-        else:
-            minrows = self.get_count()
-        return minrows - self.start()
+        if self.high_mark is None:
+            # Unsliced queries fetch a first page; the queryset asks for
+            # whatever is left once it knows numFound.
+            return self.fetch_rows
+        return self.high_mark - self.start()
 
-    def run(self):
+    def run(self, timings=None):
+        """
+        Run the query and return the decoded response. Phase timings are
+        added to `timings`; without one the query gets its own QueryTimings
+        and sends query_finished when done.
+        """
         logging.debug("running")
-        return conf.solr_connection.search(
+        own = timings is None
+        if own:
+            timings = QueryTimings()
+        with timings.phase('build'):
+            q = self.get_querystring()
+            fq = self.get_querystring(property='fq')
+            params = self.get_query_params()
+        solr = conf.solr_connection
+        response = getattr(solr, 'blocking_search', solr.search)(
+            q, fq=fq, timings=timings, **params)
+        if own:
+            timings.finish(self.model, self)
+        return response
+
+    def run_async(self):
+        """
+        Returns a Future for the response. Requires an asynchronous driver
+        such as brushfire.core.driver.asyncsolr.AsyncSolr
+        """
+        solr = conf.solr_connection
+        if not hasattr(solr, 'submit'):
+            raise BrushfireException("run_async() requires an asynchronous driver")
+        return solr.search(
             self.get_querystring(),
             fq=self.get_querystring(property='fq'),
             **self.get_query_params()
         )
 
+    def cursor(self, chunk_size):
+        """
+        Generator that pages through the whole result set using Solr's
+        cursorMark, yielding one response per page. The uniqueKey is added to
+        the sort as a tiebreaker, as Solr requires.
+        """
+        if self.low_mark:
+            raise BrushfireException("cursorMark paging cannot be combined with an offset")
+        q = self.clone()
+        pk = self.get_meta().pk.column
+        if pk not in [Solr.sort_regex.search(x).group(2) for x in q.ordering]:
+            q.add_ordering(pk)
+        q.set_use_cache(False)
+        # pages are already bounded by chunk_size
+        q.set_streaming(False)
+
+        remaining = self.high_mark
+        mark = '*'
+        while remaining is None or remaining > 0:
+            rows = chunk_size if remaining is None else min(chunk_size, remaining)
+            q.clear_limits()
+            q.set_limits(high=rows)
+            q.add_extra_params({'cursorMark': mark})
+            response = q.run()
+            docs = response.get('response', {}).get('docs', [])
+            if not docs:
+                break
+            if remaining is not None:
+                remaining -= len(docs)
+            next_mark = response.get('nextCursorMark', mark)
+            yield response
+            if next_mark == mark:
+                break
+            mark = next_mark
+
     def build_query_fragment(self, field, filter_type, value):
         fragment = ''
 
@@ -570,9 +824,23 @@ class SolrQuery(object):
             'like': u'*%s*',
         }
 
+        if isinstance(value, SearchText):
+            return u'(%s)' % value
+
         if type(value) in (set, list, tuple) and len(value) == 1:
             value = value[0]
 
+        if isinstance(value, P):
+            # the bound value is encoded by P.encode()
+            if field is None and filter_type is None:
+                return unicode(value)
+            elif filter_type == 'in':
+                return "%s:(%s)" % (field, value)
+            elif filter_type == 'range':
+                raise BrushfireException("%s__range can't be a single placeholder, "
+                        "use a pair: (P('%s_lo'), P('%s_hi'))" % (field, value.name, value.name))
+            return "%s:%s" % (field, filters[filter_type] % value)
+
         # This is what was causing the multiple quotes around the first two
         # items of a list issue
         """
@@ -597,8 +865,9 @@ class SolrQuery(object):
         elif filter_type == 'in':
             if type(value) not in (list, tuple):
                 value = [value]
-            # quote a multi-string value
-            fragment = "%s:(%s)" % (field, " OR ".join([smart_quote_string(x) for x in value]))
+            # quote a multi-string value; placeholders are encoded on bind()
+            fragment = "%s:(%s)" % (field, " OR ".join([unicode(x) if isinstance(x, P)
+                    else smart_quote_string(x) for x in value]))
         elif filter_type == 'range':
             fragment = '%s:["%s" TO "%s"]' % (field, value[0], value[1])
         return fragment
@@ -617,7 +886,7 @@ class SolrQuery(object):
 
     def get_count(self, *args, **kwargs):
         clone = self.clone()
-        clone.set_limits(high=1) # This must be > 0 -- or self.rows() will infinite loop
+        clone.set_limits(high=0) # rows=0, numFound only
         try:
             count = int(clone.run()['response']['numFound'])
         except:
@@ -625,10 +894,13 @@ class SolrQuery(object):
         return count
 
     def add_q(self, q, connector=SQ.AND, property='where'):
-        where = getattr(self, property)
+        self.compiled = None
+        where = self._own(property)
 
         if not isinstance(where, SearchNode):
-            where = SearchNode()
+            # keep the default_search() text as the first clause
+            where = SearchNode([SearchText(force_text(where))] if where else None)
+            setattr(self, property, where)
 
         where.add(q, connector)
         """
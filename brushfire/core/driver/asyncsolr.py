@@ -0,0 +1,53 @@
+import logging
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from brushfire.core.driver.solr import Solr
+from brushfire.core.exceptions import BrushfireConfigException
+
+logger = logging.getLogger('brushfire.driver.asyncsolr')
+
+class AsyncSolr(Solr):
+    """
+    Non-blocking Solr driver.
+
+    search() takes exactly the same arguments as Solr.search() but returns a
+    concurrent.futures.Future instead of the decoded response. Requests are
+    run on an executor that shares the driver's keep-alive session pool, so
+    the number of searches in flight is bounded by `workers` (by default the
+    configured connection.pool_size).
+
+    Enable it with:
+
+        BRUSHFIRE = {
+            'driver': 'brushfire.core.driver.asyncsolr.AsyncSolr',
+            'driver_options': {'workers': 50},
+            'connection': {'pool_size': 50},
+            ...
+        }
+
+    Raise connection.pool_size along with `workers`, or requests beyond the
+    pool size open and close a session each.
+    """
+    def __init__(self, *args, **kwargs):
+        workers = kwargs.pop('workers', None)
+        if ThreadPoolExecutor is None:
+            raise BrushfireConfigException("AsyncSolr requires the `futures` "
+                    "package (pip install django-brushfire[async])")
+        super(AsyncSolr, self).__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=workers or self.pool.size)
+
+    def blocking_search(self, *args, **kwargs):
+        return super(AsyncSolr, self).search(*args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.submit(self.blocking_search, *args, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
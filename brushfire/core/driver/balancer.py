@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+from time import time
+
+logger = logging.getLogger('brushfire.driver.balancer')
+
+class Replica(object):
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.latency = None # moving average, ms
+        self.failures = 0
+        self.ejected_until = 0
+
+    @property
+    def ejected(self):
+        return self.ejected_until > time()
+
+    def __repr__(self):
+        return "<Replica %s outstanding=%d latency=%s%s>" % (self.url,
+                self.outstanding, self.latency, ' ejected' if self.ejected else '')
+
+class ReplicaSet(object):
+    """
+    Spreads read requests over a list of solr replicas.
+
+    `strategy` is 'least_outstanding' (the replica with the fewest requests
+    in flight, ties broken at random) or 'latency' (random, weighted by the
+    inverse of each replica's average latency). A replica that fails
+    `eject_after` requests in a row is left out for `eject_for` seconds, or
+    until a background health check (every `health_interval` seconds, 0 to
+    disable) gets an answer from `ping_path` again.
+
+    The first host is the primary; indexing and admin requests always go
+    there.
+    """
+    STRATEGIES = ('least_outstanding', 'latency')
+    DECAY = 0.3
+
+    def __init__(self, hosts, pool, strategy='least_outstanding', eject_after=3,
+            eject_for=30, health_interval=10, ping_path='admin/ping'):
+        if strategy not in self.STRATEGIES:
+            raise ValueError("Unknown balancing strategy: %s" % strategy)
+        self.replicas = [Replica(h) for h in hosts]
+        self.pool = pool
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+        self.health_interval = health_interval
+        self.ping_path = ping_path.lstrip('/')
+        self.lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._checker = None
+
+    @property
+    def primary(self):
+        return self.replicas[0].url
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def choose(self, exclude=()):
+        """
+        Pick a replica for the next request, skipping `exclude` and ejected
+        replicas where possible
+        """
+        self.start_health_checks()
+        candidates = [r for r in self.replicas if r not in exclude]
+        healthy = [r for r in candidates if not r.ejected]
+        # with every replica ejected, trying one beats failing outright
+        candidates = healthy or candidates or self.replicas
+        if self.strategy == 'latency':
+            unknown = [r for r in candidates if r.latency is None]
+            if unknown:
+                return random.choice(unknown)
+            weights = [1.0 / max(r.latency, 0.1) for r in candidates]
+            n = random.uniform(0, sum(weights))
+            for r, w in zip(candidates, weights):
+                n -= w
+                if n <= 0:
+                    return r
+            return candidates[-1]
+        return min(candidates, key=lambda r: (r.outstanding, random.random()))
+
+    def begin(self, replica):
+        with self.lock:
+            replica.outstanding += 1
+        return time()
+
+    def success(self, replica, start):
+        ms = (time() - start) * 1000
+        with self.lock:
+            replica.outstanding -= 1
+            replica.failures = 0
+            replica.ejected_until = 0
+            if replica.latency is None:
+                replica.latency = ms
+            else:
+                replica.latency += self.DECAY * (ms - replica.latency)
+
+    def failure(self, replica, start=None):
+        with self.lock:
+            if start is not None:
+                replica.outstanding -= 1
+            replica.failures += 1
+            if replica.failures >= self.eject_after and not replica.ejected:
+                logger.warning("Ejecting %s for %ds after %d failures", replica.url,
+                        self.eject_for, replica.failures)
+                replica.ejected_until = time() + self.eject_for
+
+    def check(self):
+        """
+        Ping every replica once, reinstating the ones that answer
+        """
+        for replica in self.replicas:
+            try:
+                resp = self.pool.get("%s/%s" % (replica.url, self.ping_path),
+                        params={'wt': 'json'}, timeout=5)
+                ok = resp.status_code == 200
+            except Exception as e:
+                logger.debug("Health check of %s failed: %s", replica.url, e)
+                ok = False
+            if ok and (replica.failures or replica.ejected):
+                logger.info("Reinstating %s", replica.url)
+                with self.lock:
+                    replica.failures = 0
+                    replica.ejected_until = 0
+            elif not ok:
+                self.failure(replica)
+
+    def start_health_checks(self):
+        if self._checker is not None or not self.health_interval:
+            return
+        with self.lock:
+            if self._checker is not None:
+                return
+            self._checker = threading.Thread(target=self._run_health_checks,
+                    name='brushfire-health-check')
+            self._checker.daemon = True
+            self._checker.start()
+
+    def _run_health_checks(self):
+        while not self._stopped.wait(self.health_interval):
+            self.check()
+
+    def close(self):
+        self._stopped.set()
@@ -0,0 +1,327 @@
+"""
+Response codecs: what `wt` solr is asked for and how the body is decoded.
+Whatever the codec, search() returns the same structure the JSON response
+writer produces (with the default json.nl=flat), so nothing above the
+driver, including the response cache, needs to know which one is in use.
+"""
+import json
+import struct
+from base64 import b64encode
+from datetime import datetime, timedelta
+
+from brushfire.utils import import_class
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+class Codec(object):
+    wt = None
+
+    def decode(self, content):
+        """
+        Turn a response body into python data. Raises ValueError if the body
+        can't be decoded.
+        """
+        raise NotImplementedError
+
+class JSONCodec(Codec):
+    """
+    `backend` is 'ujson', 'simplejson' or 'json'; by default the fastest one
+    installed is used
+    """
+    wt = 'json'
+    BACKENDS = ('ujson', 'simplejson', 'json')
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = 'ujson' if ujson else 'simplejson' if simplejson else 'json'
+        if backend not in self.BACKENDS:
+            raise ValueError("Unknown JSON backend: %s" % backend)
+        if backend == 'ujson':
+            if ujson is None:
+                raise ValueError("The ujson backend requires the ujson package")
+            # the default loses precision on some doubles
+            self.loads = lambda s: ujson.loads(s, precise_float=True)
+        elif backend == 'simplejson':
+            if simplejson is None:
+                raise ValueError("The simplejson backend requires the simplejson package")
+            self.loads = simplejson.loads
+        else:
+            self.loads = json.loads
+        self.backend = backend
+
+    def decode(self, content):
+        return self.loads(content)
+
+# javabin tags, see org.apache.solr.common.util.JavaBinCodec
+NULL = 0
+BOOL_TRUE = 1
+BOOL_FALSE = 2
+BYTE = 3
+SHORT = 4
+DOUBLE = 5
+INT = 6
+LONG = 7
+FLOAT = 8
+DATE = 9
+MAP = 10
+SOLRDOC = 11
+SOLRDOCLST = 12
+BYTEARR = 13
+ITERATOR = 14
+END = 15
+SOLRINPUTDOC = 16
+MAP_ENTRY_ITER = 17
+ENUM_FIELD_VALUE = 18
+MAP_ENTRY = 19
+UUID = 20
+# the top three bits of these carry the type, the rest a size or value
+STR = 1
+SINT = 2
+SLONG = 3
+ARR = 4
+ORDERED_MAP = 5
+NAMED_LST = 6
+EXTERN_STRING = 7
+
+EPOCH = datetime(1970, 1, 1)
+_INT = struct.Struct('>i')
+_LONG = struct.Struct('>q')
+_SHORT = struct.Struct('>h')
+_BYTE = struct.Struct('>b')
+_FLOAT = struct.Struct('>f')
+_DOUBLE = struct.Struct('>d')
+_END = object()
+
+class _Document(dict):
+    pass
+
+def _float(value):
+    # the shortest repr that survives the trip through a 32 bit float, which
+    # is what the JSON writer prints
+    for precision in (6, 7, 8, 9):
+        s = '%.*g' % (precision, value)
+        if _FLOAT.unpack(_FLOAT.pack(float(s)))[0] == value:
+            return float(s)
+    return value
+
+def _date(ms):
+    seconds, ms = divmod(ms, 1000)
+    d = EPOCH + timedelta(seconds=seconds)
+    # not strftime, which refuses years before 1900
+    s = '%04d-%02d-%02dT%02d:%02d:%02d' % (d.year, d.month, d.day,
+            d.hour, d.minute, d.second)
+    if ms:
+        s += '.%03d' % ms
+    return s + 'Z'
+
+class JavabinDecoder(object):
+    """
+    Decodes one javabin (version 2) response body
+    """
+    VERSION = 2
+
+    def __init__(self, content):
+        self.data = content
+        self.pos = 0
+        self.strings = []
+
+    def decode(self):
+        if not self.data or ord(self.data[0]) != self.VERSION:
+            raise ValueError("Not a javabin version %d response" % self.VERSION)
+        self.pos = 1
+        tag = self._byte()
+        # solr sends a SimpleOrderedMap, older versions a plain NamedList;
+        # either way the JSON writer makes an object of it
+        if tag >> 5 not in (ORDERED_MAP, NAMED_LST):
+            raise ValueError("Expected a map or named list, got tag %d" % tag)
+        return self._map(tag)
+
+    def _byte(self):
+        b = ord(self.data[self.pos])
+        self.pos += 1
+        return b
+
+    def _unpack(self, s):
+        value = s.unpack_from(self.data, self.pos)[0]
+        self.pos += s.size
+        return value
+
+    def _vint(self):
+        b = self._byte()
+        value = b & 0x7f
+        shift = 7
+        while b & 0x80:
+            b = self._byte()
+            value |= (b & 0x7f) << shift
+            shift += 7
+        return value
+
+    def _size(self, tag):
+        size = tag & 0x1f
+        if size == 0x1f:
+            size += self._vint()
+        return size
+
+    def _str(self, tag):
+        size = self._size(tag)
+        s = self.data[self.pos:self.pos + size].decode('utf-8')
+        self.pos += size
+        return s
+
+    def _small(self, tag):
+        value = tag & 0x0f
+        if tag & 0x10:
+            value |= self._vint() << 4
+        return value
+
+    def _map(self, tag):
+        result = {}
+        for _ in xrange(self._size(tag)):
+            key = self.value()
+            result[key] = self.value()
+        return result
+
+    def _named_list(self, tag):
+        result = []
+        for _ in xrange(self._size(tag)):
+            result.append(self.value())
+            result.append(self.value())
+        return result
+
+    def _document(self):
+        doc = _Document()
+        for _ in xrange(self._size(self._byte())):
+            name = self.value()
+            # child documents are written in place of a field name
+            if isinstance(name, _Document):
+                doc.setdefault('_childDocuments_', []).append(name)
+            else:
+                doc[name] = self.value()
+        return doc
+
+    def _document_list(self):
+        header = self.value()
+        docs = self.value()
+        result = {'numFound': header[0], 'start': header[1], 'docs': docs}
+        if header[2] is not None:
+            result['maxScore'] = header[2]
+        if len(header) > 3:
+            result['numFoundExact'] = header[3]
+        return result
+
+    def value(self):
+        tag = self._byte()
+        kind = tag >> 5
+        if kind == STR:
+            return self._str(tag)
+        elif kind == SINT or kind == SLONG:
+            return self._small(tag)
+        elif kind == ARR:
+            return [self.value() for _ in xrange(self._size(tag))]
+        elif kind == ORDERED_MAP:
+            return self._map(tag)
+        elif kind == NAMED_LST:
+            return self._named_list(tag)
+        elif kind == EXTERN_STRING:
+            index = self._size(tag)
+            if index:
+                return self.strings[index - 1]
+            s = self.value()
+            self.strings.append(s)
+            return s
+
+        if tag == NULL:
+            return None
+        elif tag == BOOL_TRUE:
+            return True
+        elif tag == BOOL_FALSE:
+            return False
+        elif tag == INT:
+            return self._unpack(_INT)
+        elif tag == LONG:
+            return self._unpack(_LONG)
+        elif tag == FLOAT:
+            return _float(self._unpack(_FLOAT))
+        elif tag == DOUBLE:
+            return self._unpack(_DOUBLE)
+        elif tag == SHORT:
+            return self._unpack(_SHORT)
+        elif tag == BYTE:
+            return self._unpack(_BYTE)
+        elif tag == DATE:
+            return _date(self._unpack(_LONG))
+        elif tag == MAP:
+            result = {}
+            for _ in xrange(self._vint()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        elif tag == SOLRDOC:
+            return self._document()
+        elif tag == SOLRDOCLST:
+            return self._document_list()
+        elif tag == BYTEARR:
+            size = self._vint()
+            s = self.data[self.pos:self.pos + size]
+            self.pos += size
+            return b64encode(s)
+        elif tag == ITERATOR:
+            items = []
+            while True:
+                item = self.value()
+                if item is _END:
+                    return items
+                items.append(item)
+        elif tag == MAP_ENTRY_ITER:
+            result = {}
+            while True:
+                key = self.value()
+                if key is _END:
+                    return result
+                result[key] = self.value()
+        elif tag == END:
+            return _END
+        elif tag == ENUM_FIELD_VALUE:
+            self.value() # the ordinal; JSON only has the name
+            return self.value()
+        elif tag == MAP_ENTRY:
+            key = self.value()
+            return {key: self.value()}
+        elif tag == UUID:
+            s = self.data[self.pos:self.pos + 16].encode('hex')
+            self.pos += 16
+            return '-'.join((s[:8], s[8:12], s[12:16], s[16:20], s[20:]))
+        raise ValueError("Unknown javabin tag %d at offset %d" % (tag, self.pos - 1))
+
+class JavabinCodec(Codec):
+    """
+    Solr's binary format: smaller responses, and numbers arrive as binary
+    instead of text that has to be parsed
+    """
+    wt = 'javabin'
+
+    def decode(self, content):
+        try:
+            return JavabinDecoder(content).decode()
+        except (IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError("Truncated or corrupt javabin response: %s" % e)
+
+CODECS = {
+    'json': JSONCodec,
+    'javabin': JavabinCodec,
+}
+
+def get_codec(name='json', **options):
+    """
+    A codec by name ('json' or 'javabin') or by the path to a Codec subclass
+    """
+    cls = CODECS.get(name) or import_class(name)
+    return cls(**options)
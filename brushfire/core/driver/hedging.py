@@ -0,0 +1,91 @@
+import logging
+import threading
+from collections import deque
+from Queue import Queue, Empty
+from time import time
+
+logger = logging.getLogger('brushfire.driver.hedging')
+
+class Hedger(object):
+    """
+    Hedged requests: when a request has taken longer than the `percentile`
+    latency of recent requests to the same handler, a duplicate is sent and
+    whichever answers first wins. Only a few percent of requests get a
+    second copy, but a single slow node no longer sets the tail latency.
+
+    Hedging starts once `min_samples` latencies have been seen for a handler;
+    the last `window` of them are kept.
+    """
+    def __init__(self, percentile=95, window=200, min_samples=20, min_delay=0.005):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.hedged = 0
+
+    def record(self, handler, seconds):
+        with self.lock:
+            samples = self.samples.get(handler)
+            if samples is None:
+                samples = self.samples[handler] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def delay(self, handler):
+        """
+        Seconds to wait before hedging a request to `handler`, or None while
+        there aren't enough samples yet
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(handler, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100.0))
+        return max(samples[index], self.min_delay)
+
+    def run(self, handler, func):
+        """
+        Call func(), hedging it with a second call if the first one is slow.
+        The first successful result is returned; an exception is only raised
+        if every call failed.
+        """
+        delay = self.delay(handler)
+        if delay is None:
+            start = time()
+            result = func()
+            self.record(handler, time() - start)
+            return result
+
+        results = Queue()
+        def attempt():
+            try:
+                results.put((True, func()))
+            except Exception as e:
+                results.put((False, e))
+
+        start = time()
+        pending = 1
+        self._start(attempt)
+        try:
+            ok, value = results.get(timeout=delay)
+        except Empty:
+            logger.debug("Hedging %s request after %.1fms", handler, delay * 1000)
+            self.hedged += 1
+            pending += 1
+            self._start(attempt)
+            ok, value = results.get()
+        pending -= 1
+        while not ok and pending:
+            ok, value = results.get()
+            pending -= 1
+        if not ok:
+            raise value
+        # record what the caller waited, not just the winning request
+        self.record(handler, time() - start)
+        return value
+
+    def _start(self, target):
+        t = threading.Thread(target=target, name='brushfire-hedge')
+        t.daemon = True
+        t.start()
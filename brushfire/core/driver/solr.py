@@ -1,9 +1,22 @@
 import requests
 import logging
+import json
 import re
+import random
+from time import time, sleep
+from contextlib import contextmanager
+from Queue import LifoQueue, Empty, Full
 from urllib import  urlencode as e
 from urlparse import parse_qsl as d
+from requests.adapters import HTTPAdapter
 from brushfire.core.types import GroupedFRange
+from brushfire.core.driver.codecs import JSONCodec
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
 
 URL_LENGTH_MAX = 1024
 DEFAULT = 0xDEFA17
@@ -17,6 +30,12 @@ class Url(object):
         self.params = params
         self.qs = e(params) if len(params) else ''
 
+    def on(self, start):
+        """
+        The same request against another host
+        """
+        return Url(start, self.path, self.params)
+
     @property
     def fullurl(self):
         qs = ""
@@ -68,25 +87,193 @@ class Url(object):
         return self.__repr__()
 
 class SolrException(Exception):
-    def __init__(self, msg, type="Unknown"):
+    def __init__(self, msg, type="Unknown", status=None):
         self.type = type
+        self.status = status
         super(SolrException, self).__init__(msg)
 
 class SolrResponseException(SolrException):
     def __init__(self, msg):
         super(SolrResponseException, self).__init__(msg, "Response Error")
 
+class StreamingResponse(object):
+    """
+    An incrementally parsed Solr response.
+
+    Iterating yields the documents in response.docs one at a time as they are
+    read off the socket, so only one document is held in memory at a time.
+    Everything else in the response is collected into `data` (with an empty
+    docs list); the header and numFound are available as soon as the first
+    document has been yielded, the rest once iteration is done.
+    """
+    DOCS = 'response.docs.item'
+
+    def __init__(self, response):
+        self.response = response
+        self._builder = ObjectBuilder()
+
+    @property
+    def data(self):
+        return self._builder.value if hasattr(self._builder, 'value') else {}
+
+    @property
+    def num_found(self):
+        return self.data.get('response', {}).get('numFound')
+
+    def _events(self):
+        self.response.raw.decode_content = True
+        try:
+            return ijson.parse(self.response.raw, use_float=True)
+        except TypeError:
+            # ijson < 3.1
+            return ijson.parse(self.response.raw)
+
+    def __iter__(self):
+        events = self._events()
+        try:
+            for prefix, event, value in events:
+                if prefix == self.DOCS and event == 'start_map':
+                    doc = ObjectBuilder()
+                    doc.event(event, value)
+                    for prefix, event, value in events:
+                        doc.event(event, value)
+                        if prefix == self.DOCS and event == 'end_map':
+                            break
+                    yield doc.value
+                else:
+                    self._builder.event(event, value)
+        finally:
+            self.response.close()
+
+class TupleStream(StreamingResponse):
+    """
+    The tuples of a streaming expression response, read lazily. Iteration
+    stops at the EOF tuple (kept as `eof`, it carries RESPONSE_TIME) and an
+    EXCEPTION tuple raises SolrException. Without ijson the response is
+    parsed in one go instead.
+    """
+    DOCS = 'result-set.docs.item'
+
+    def __init__(self, response):
+        self.response = response
+        self._builder = ObjectBuilder() if ijson is not None else None
+        self.eof = None
+
+    def _tuples(self):
+        if ijson is not None:
+            return super(TupleStream, self).__iter__()
+        try:
+            return iter(self.response.json().get('result-set', {}).get('docs', []))
+        finally:
+            self.response.close()
+
+    def __iter__(self):
+        tuples = self._tuples()
+        try:
+            for t in tuples:
+                if 'EXCEPTION' in t:
+                    raise SolrException(t['EXCEPTION'], "Stream Error")
+                if t.get('EOF'):
+                    self.eof = t
+                    break
+                yield t
+        finally:
+            if hasattr(tuples, 'close'):
+                tuples.close()
+
+class SessionPool(object):
+    """
+    A thread-safe pool of keep-alive ``requests.Session`` objects.
+
+    Each session carries its own urllib3 connection pool, so reusing sessions
+    reuses TCP (and TLS) connections to Solr instead of opening a new one for
+    every request. Sessions that have sat idle for longer than `keepalive`
+    seconds are closed and replaced, since Solr's container has most likely
+    dropped the connection by then anyway.
+    """
+    def __init__(self, size=10, max_connections=10, keepalive=60):
+        self.size = size
+        self.max_connections = max_connections
+        self.keepalive = keepalive
+        self._sessions = LifoQueue(size)
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.size,
+                pool_maxsize=self.max_connections)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def acquire(self):
+        while True:
+            try:
+                session, last_used = self._sessions.get_nowait()
+            except Empty:
+                return self._new_session()
+            if self.keepalive and time() - last_used > self.keepalive:
+                session.close()
+                continue
+            return session
+
+    def release(self, session):
+        try:
+            self._sessions.put_nowait((session, time()))
+        except Full:
+            session.close()
+
+    @contextmanager
+    def session(self):
+        s = self.acquire()
+        try:
+            yield s
+        finally:
+            self.release(s)
+
+    def get(self, url, **kwargs):
+        with self.session() as s:
+            return s.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        with self.session() as s:
+            return s.post(url, **kwargs)
+
+    def send(self, request, **kwargs):
+        with self.session() as s:
+            return s.send(request, **kwargs)
+
+    def close(self):
+        while True:
+            try:
+                session, last_used = self._sessions.get_nowait()
+            except Empty:
+                break
+            session.close()
+
 class Solr(object):
     sort_regex = re.compile('(\+|-)?(.*)')
     def __init__(self, server, core='', query_handler='select', lparams='',
-            cache=None, fields='*,score', rows=20):
+            cache=None, fields='*,score', rows=20, pool=None, replicas=None,
+            timeouts=None, retries=0, backoff=0.05, hedger=None, codec=None):
         self.solr = server
+        self.pool = pool or SessionPool()
+        # a balancer.ReplicaSet for reads; self.solr is its primary
+        self.replicas = replicas
+        # {'connect': s, 'read': s, 'handlers': {handler: {'read': s}}}
+        self.timeouts = timeouts or {}
+        self.retries = retries
+        self.backoff = backoff
+        # a hedging.Hedger, for searches
+        self.hedger = hedger
+        # a codecs.Codec, for searches
+        self.codec = codec or JSONCodec()
         self.default_core = core
         self.cache = cache
         self.query_handler = query_handler
         self.lparams = lparams
         self.fields = fields
         self.rows = rows
+        self._schema_fields = {}
 
     def _url(self, path, query):
         path = path if path.startswith('/') else "/%s" % path
@@ -99,6 +286,8 @@ class Solr(object):
         if query.get('facet'):
             ff = query.pop('facet.fields')
             query_params += [('facet.field',x) for x in ff]
+        if query.get('collapse'):
+            query_params.append(('fq', query.pop('collapse')))
         if query.get('frange') or type(query.get('frange')) in (list, tuple):
             fr = query.pop('frange')
             for f in fr:
@@ -133,35 +322,120 @@ class Solr(object):
 
 
     def _raw(self, path, **kwargs):
-        url = self._url(path, kwargs)
+        return self._request(self._url(path, kwargs))
+
+    def timeout_for(self, handler):
+        """
+        (connect, read) timeout in seconds for requests to `handler`
+        """
+        t = self.timeouts.get('handlers', {}).get(handler.strip('/'), {})
+        return (t.get('connect', self.timeouts.get('connect')),
+                t.get('read', self.timeouts.get('read')))
+
+    @staticmethod
+    def retryable(e):
+        """
+        Connection errors, timeouts and 5xx responses are worth another try;
+        anything else would fail the same way again
+        """
+        if isinstance(e, SolrException):
+            return e.status is None or e.status >= 500
+        return isinstance(e, (requests.ConnectionError, requests.Timeout))
 
-        if len(url.rightside) > URL_LENGTH_MAX:
+    def _read(self, url, stream=False, post=False, retry=True, timeout=None):
+        """
+        _request() for read-only requests. Failed requests (see retryable())
+        are retried up to `retries` times after a jittered exponential
+        backoff, unless retry=False. With replicas configured each attempt
+        goes to a replica picked by the balancer, a different one each time
+        if possible.
+        """
+        tried = []
+        attempts = 1 + (self.retries if retry else 0)
+        for attempt in range(attempts):
+            if attempt:
+                # "full jitter": anywhere between 0 and the exponential backoff
+                sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            replica = None
+            if self.replicas is not None:
+                replica = self.replicas.choose(exclude=tried)
+                tried.append(replica)
+            try:
+                return self._send(url, replica, stream, post, timeout)
+            except Exception as e:
+                if not self.retryable(e) or attempt == attempts - 1:
+                    raise
+                logger.warning("Request to %s failed (%s), retrying",
+                        replica.url if replica else url.hostpart, e)
+
+    def _send(self, url, replica, stream, post, timeout):
+        if replica is None:
+            return self._request(url, stream, post, timeout)
+        start = self.replicas.begin(replica)
+        try:
+            resp = self._request(url.on(replica.url), stream, post, timeout)
+        except Exception as e:
+            if self.retryable(e):
+                self.replicas.failure(replica, start)
+            else:
+                # the node is fine, the request isn't
+                self.replicas.success(replica, start)
+            raise
+        self.replicas.success(replica, start)
+        return resp
+
+    def _request(self, url, stream=False, post=False, timeout=None):
+        timeout = timeout or self.timeout_for(url.path.rsplit('/', 1)[-1])
+        if post or len(url.rightside) > URL_LENGTH_MAX:
             logger.debug("Requesting[POST] %s with body: %s", url.urlpart, url.pretty_qspart)
-            resp = requests.post(url.urlpart, data=url.query_params,
+            resp = self.pool.post(url.urlpart, data=url.query_params, stream=stream,
+                    timeout=timeout,
                     headers={'content-type': 'application/x-www-form-urlencoded'})
             if resp.status_code != 200:
                 logger.debug("Method: POST")
                 logger.debug("url: %s", resp.url)
                 logger.error("Error[%d]: url: %s", resp.status_code, resp.url)
                 try:
-                    raise SolrException("Request returned status[%d]: %r" % (resp.status_code, resp.json()))
+                    msg = "Request returned status[%d]: %r" % (resp.status_code, resp.json())
                 except ValueError:
-                    raise SolrException("Request returned status[%d]: %s" % (resp.status_code, resp.content))
+                    msg = "Request returned status[%d]: %s" % (resp.status_code, resp.content)
+                raise SolrException(msg, status=resp.status_code)
         else:
             logger.debug("Requesting[GET] %s", url)
-            resp = requests.get(url.urlpart, params=url.query_params)
+            resp = self.pool.get(url.urlpart, params=url.query_params, stream=stream,
+                    timeout=timeout)
 
         if resp.status_code != 200:
-            e = SolrException("Request returned status[%d]: %s" % (resp.status_code, resp.content))
+            e = SolrException("Request returned status[%d]: %s" % (resp.status_code, resp.content),
+                    status=resp.status_code)
             logger.error("Error[%d]: url: %s", resp.status_code, resp.url)
             logger.exception(e)
             raise e
 
         return resp
 
+    @staticmethod
+    def partial(data):
+        """
+        True for a response cut short by timeAllowed; those aren't cached
+        """
+        return bool((data.get('responseHeader') or {}).get('partialResults'))
+
+    @staticmethod
+    def format_sort(sort):
+        # turn ['+foo', '-bar', 'baz'] into "foo asc,bar desc,baz asc"
+        if isinstance(sort, basestring):
+            sort = [sort]
+        return ','.join(
+                ["%s asc" % field if direction in (None, '+') else "%s desc" % field
+                    for direction, field in [
+                        Solr.sort_regex.search(x).groups() for x in sort]])
+
     def search(self, query, fields=DEFAULT, lparams=DEFAULT,
                handler=DEFAULT, core=DEFAULT, start=0, rows=DEFAULT, raw=False,
-               sort=[], facet=[], fq=None, frange=[], stats=[], stats_facets=[], **kwargs):
+               sort=[], facet=[], fq=None, frange=[], stats=[], stats_facets=[],
+               json_facet=None, group=None, collapse=None, use_cache=True,
+               stream=False, timings=None, **kwargs):
         if handler == DEFAULT:
             handler = self.query_handler
         if core == DEFAULT:
@@ -173,11 +447,7 @@ class Solr(object):
         if rows == DEFAULT:
             rows = self.rows
 
-        # turn ['+foo', '-bar', 'baz'] into "foo asc,bar desc,baz asc"
-        sort = ','.join(
-                ["%s asc" % field if direction in (None, '+') else "%s desc" % field
-                    for direction, field in [
-                        Solr.sort_regex.search(x).groups() for x in sort]])
+        sort = self.format_sort(sort)
 
         path = "%s/%s" % (core, handler)
         f_query = ""
@@ -187,7 +457,9 @@ class Solr(object):
             f_query = lparams+query
         q = {
             'q': f_query,
-            'wt': 'json', # Should this be overridable?
+            # streamed responses are parsed incrementally and raw ones are
+            # handed to the caller as they are; both are always JSON
+            'wt': 'json' if stream or raw else self.codec.wt,
             'fl': fields,
             'rows': rows,
             'start': start,
@@ -210,21 +482,175 @@ class Solr(object):
                 })
         if fq:
             q['fq'] = fq
+        if json_facet:
+            q['json.facet'] = json_facet
+        if group:
+            q.update({
+                'group': True,
+                'group.field': group['field'],
+                'group.limit': group.get('limit', 1),
+                'group.sort': self.format_sort(group.get('sort') or []),
+                'group.ngroups': True,
+            })
+        if collapse:
+            local = u"field=%s" % collapse['field']
+            if collapse.get('sort'):
+                local += u" sort='%s'" % self.format_sort(collapse['sort'])
+            if collapse.get('null_policy'):
+                local += u" nullPolicy=%s" % collapse['null_policy']
+            q['collapse'] = u"{!collapse %s}" % local
+            if collapse.get('expand'):
+                q.update({
+                    'expand': True,
+                    'expand.rows': collapse['expand'],
+                })
 
         q.update(kwargs)
-        try:
-            response = self._raw(path, **q)
-        except Exception as e:
-            logger.exception(e)
-            raise
+        url = self._url(path, q)
+
+        if stream and not raw:
+            if ijson is None:
+                raise SolrException("Streaming responses require the ijson package")
+            start = time()
+            response = StreamingResponse(self._read(url, stream=True))
+            if timings is not None:
+                timings.add_request(url, (time() - start) * 1000, 0, 0)
+            return response
+
+        content = key = None
+        if use_cache and self.cache is not None and self.cache.timeout_for(handler):
+            key = self.cache.make_key(url)
+            content = self.cache.get(key)
+
+        start = time()
+        cached = content is not None
+        if content is None:
+            try:
+                if self.hedger is not None:
+                    content = self.hedger.run(handler, lambda: self._read(url).content)
+                else:
+                    content = self._read(url).content
+            except Exception as e:
+                logger.exception(e)
+                raise
+        else:
+            logger.debug("Cache hit for %s", url)
+        network = (time() - start) * 1000
+        store = key is not None and not cached
 
         if raw:
-            return response.content
+            if store:
+                try:
+                    store = not self.partial(json.loads(content))
+                except ValueError:
+                    store = False
+            if store:
+                self.cache.set(key, content, handler)
+            if timings is not None:
+                timings.add_request(url, network, 0, 0, cached)
+            return content
+        start = time()
         try:
-            return response.json()
+            data = self.codec.decode(content)
         except ValueError as e:
-            raise SolrResponseException("Error decoding JSON response from Solr, "\
-                    "possible misconfiguration. Content: %s" % response.content)
+            raise SolrResponseException("Error decoding %s response from Solr, "\
+                    "possible misconfiguration. Content: %r" % (self.codec.wt, content[:1024]))
+        if store and not self.partial(data):
+            self.cache.set(key, content, handler)
+        if timings is not None:
+            qtime = 0 if cached else data.get('responseHeader', {}).get('QTime', 0)
+            timings.add_request(url, network, (time() - start) * 1000, qtime, cached)
+        return data
+
+    def schema_fields(self, core=DEFAULT):
+        """
+        Returns {name: properties} for the fields of `core` (defaults filled
+        in), fetched from the schema API once per core
+        """
+        if core == DEFAULT:
+            core = self.default_core
+        fields = self._schema_fields.get(core)
+        if fields is None:
+            resp = self._read(self._url("%s/schema/fields" % core,
+                    {'showDefaults': True, 'wt': 'json'}))
+            fields = self._schema_fields[core] = dict(
+                    (f['name'], f) for f in resp.json().get('fields', []))
+        return fields
+
+    def export(self, query, fields, sort, fq=None, frange=[], core=DEFAULT,
+            handler='export'):
+        """
+        Stream every document matching `query` through the /export handler,
+        returning a StreamingResponse. Solr requires all of `fields` and the
+        `sort` fields to have docValues; that is checked against the schema
+        up front. Requires the ijson package.
+        """
+        if ijson is None:
+            raise SolrException("Exporting requires the ijson package", "Export Error")
+        if core == DEFAULT:
+            core = self.default_core
+        if isinstance(sort, basestring):
+            sort = [sort]
+
+        schema = self.schema_fields(core)
+        names = set(fields) | set(Solr.sort_regex.search(x).group(2) for x in sort)
+        missing = sorted(n for n in names if not schema.get(n, {}).get('docValues'))
+        if missing:
+            raise SolrException("Fields must have docValues to be exported: %s" %
+                    ', '.join(missing), "Export Error")
+
+        q = {
+            'q': query,
+            'wt': 'json',
+            'fl': ','.join(fields),
+            'sort': self.format_sort(sort),
+            'frange': frange,
+        }
+        if fq:
+            q['fq'] = fq
+        url = self._url("%s/%s" % (core, handler.lstrip('/')), q)
+        return StreamingResponse(self._read(url, stream=True))
+
+    def stream(self, expr, core=DEFAULT, handler='stream'):
+        """
+        Run a streaming expression (see brushfire.streams) on the /stream
+        handler, returning a lazy TupleStream
+        """
+        if core == DEFAULT:
+            core = self.default_core
+        url = self._url("%s/%s" % (core, handler.lstrip('/')), {'expr': expr})
+        # expressions can write (update, commit), so they are never retried
+        return TupleStream(self._read(url, stream=True, post=True, retry=False))
+
+    def add(self, docs, core=DEFAULT, commit_within=None, commit=False):
+        """
+        Post a batch of documents (a list of dicts) to the core's /update
+        handler as JSON
+        """
+        logger.debug("Posting %d documents", len(docs))
+        return self._update(docs, core, commitWithin=commit_within,
+                commit=commit or None)
+
+    def delete_by_query(self, query, core=DEFAULT, commit=False):
+        return self._update({'delete': {'query': query}}, core,
+                commit=commit or None)
+
+    def commit(self, core=DEFAULT):
+        return self._update({'commit': {}}, core)
+
+    def _update(self, body, core=DEFAULT, **params):
+        if core == DEFAULT:
+            core = self.default_core
+        params['wt'] = 'json'
+        url = self._url("%s/update" % core, params)
+        resp = self.pool.post(url.urlpart, params=url.query_params,
+                data=json.dumps(body), timeout=self.timeout_for('update'),
+                headers={'content-type': 'application/json'})
+        if resp.status_code != 200:
+            e = SolrException("Update returned status[%d]: %s" % (resp.status_code, resp.content))
+            logger.error("Error[%d]: url: %s", resp.status_code, resp.url)
+            raise e
+        return resp.json()
 
 if __name__ == '__main__':
     l = logging.getLogger('brushfire')
@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+class Hydrator(object):
+    """
+    Turns Solr documents into model instances.
+
+    Everything that only depends on the model, the requested field list and
+    allow_non_model_fields is worked out once, here, instead of for every
+    document. Instances are built without calling __init__ by assigning their
+    __dict__ in one go.
+    """
+    def __init__(self, model, fields, allow_non_model_fields=False):
+        self.model = model
+        self.model_fields = frozenset(f.name for f in model._meta.fields)
+        # When every requested field is a model field there is nothing to
+        # filter out, so the document can be copied wholesale.
+        self.copy_all = allow_non_model_fields or \
+                ('*' not in fields and self.model_fields.issuperset(fields))
+        # (name, decoder) for every returned field whose type declares one.
+        # score is a float whatever the model says.
+        returned = set(f.split(':')[0] for f in fields)
+        self.decoders = [(f.name, f.decoder) for f in model._meta.fields
+                if getattr(f, 'decoder', None) is not None and f.name != 'score'
+                and ('*' in returned or f.name in returned)]
+
+    def decode(self, docs):
+        """
+        Convert raw JSON values in-place using the field decoders, one column
+        at a time over the whole batch of documents
+        """
+        for name, decoder in self.decoders:
+            for doc in docs:
+                value = doc.get(name)
+                if value is not None:
+                    if type(value) is list:
+                        doc[name] = [decoder(x) for x in value]
+                    else:
+                        doc[name] = decoder(value)
+        return docs
+
+    def __call__(self, doc):
+        obj = self.model.__new__(self.model)
+        if self.copy_all:
+            obj.__dict__ = dict(doc)
+        else:
+            fields = self.model_fields
+            obj.__dict__ = dict((k, v) for k, v in doc.iteritems() if k in fields)
+        return obj
+
+def get_hydrator(model, fields, allow_non_model_fields=False):
+    """
+    Returns the Hydrator for (model, fields, allow_non_model_fields), compiling
+    and caching it on the model the first time it is asked for
+    """
+    key = (tuple(fields), bool(allow_non_model_fields))
+    cache = model.__dict__.get('_brushfire_hydrators')
+    if cache is None:
+        cache = {}
+        setattr(model, '_brushfire_hydrators', cache)
+    hydrator = cache.get(key)
+    if hydrator is None:
+        hydrator = cache[key] = Hydrator(model, fields, allow_non_model_fields)
+    return hydrator
+
+def get_record_class(model, fields):
+    """
+    Returns a read-only, __slots__-based row type (a namedtuple) for `fields`
+    of `model`, cached on the model
+    """
+    fields = tuple(fields)
+    cache = model.__dict__.get('_brushfire_records')
+    if cache is None:
+        cache = {}
+        setattr(model, '_brushfire_records', cache)
+    cls = cache.get(fields)
+    if cls is None:
+        pk = model._meta.pk.attname
+        base = namedtuple('%sRecord' % model.__name__, fields)
+        cls = cache[fields] = type(base.__name__, (base,), {
+            '__slots__': (),
+            'pk': property(lambda self: getattr(self, pk, None)),
+        })
+    return cls
@@ -1,7 +1,11 @@
 from itertools import chain
+import datetime
 import inspect
 from brushfire.core.query import BrushfireQuerySet
 from brushfire.core.exceptions import *
+from brushfire.core.settings import configuration as conf
+from brushfire.core.decoders import decode_bool, decode_date
+from brushfire.utils import format_solr_date
 from django.apps import apps
 from django.db import models
 from django.db.models.base import subclass_exception
@@ -19,39 +23,39 @@ logger = logging.getLogger('brushfire.core')
 ################################################################################
 
 class BooleanField(models.BooleanField):
-    pass
+    decoder = staticmethod(decode_bool)
 
 # Numeric Fields
 class IntegerField(models.IntegerField):
-    pass
+    decoder = int
 
 class FloatField(models.FloatField):
-    pass
+    decoder = float
 
 class LongField(models.IntegerField):
-    pass
+    decoder = int
 
 class DoubleField(models.FloatField):
-    pass
+    decoder = float
 
 class TrieIntegerField(models.IntegerField):
-    pass
+    decoder = int
 
 class TrieFloatField(models.FloatField):
-    pass
+    decoder = float
 
 class TrieLongField(models.IntegerField):
-    pass
+    decoder = int
 
 class TrieDoubleField(models.FloatField):
-    pass
+    decoder = float
 
 # Date Fields
 class DateField(models.DateTimeField):
-    pass
+    decoder = staticmethod(decode_date)
 
 class TrieDateField(models.DateTimeField):
-    pass
+    decoder = staticmethod(decode_date)
 
 # Character Fields
 class TextField(models.TextField):
@@ -227,3 +231,29 @@ class BrushfireModel(six.with_metaclass(BrushfireModelBase)):
     def __init__(self, *args, **kwargs):
         for k,v in kwargs.items():
             setattr(self, k, v)
+
+    def to_document(self):
+        """
+        Serialize the instance's declared fields into a dict suitable for
+        posting to Solr's /update handler
+        """
+        doc = {}
+        for f in self._meta.fields:
+            if f.name == 'score':
+                continue
+            value = getattr(self, f.attname, None)
+            if value is None:
+                continue
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = format_solr_date(value)
+            elif isinstance(value, (list, tuple, set)):
+                value = [format_solr_date(x)
+                        if isinstance(x, (datetime.date, datetime.datetime))
+                        else x for x in value]
+            doc[f.name] = value
+        return doc
+
+    def save(self, commit_within=None, commit=False):
+        conf.solr_connection.add([self.to_document()],
+                commit_within=commit_within, commit=commit)
+
@@ -1,9 +1,18 @@
 import json
+import threading
+from time import time
 
 from collections import OrderedDict
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 
-from brushfire.core.driver import SolrQuery, SQ
+from brushfire.core.driver import SolrQuery, SQ, DEFAULT
 from brushfire.core.exceptions import BrushfireException
+from brushfire.core.settings import configuration as conf
+from brushfire.core.hydrate import get_hydrator, get_record_class
+from brushfire.core.types import P
+from brushfire.core.timing import QueryTimings
+from brushfire.facets import Aggregate, Terms, as_json, named_aggregates, aggregate_values
 from django.db.models.query import QuerySet
 from django.utils.datastructures import SortedDict
 from django.utils.importlib import import_module
@@ -23,7 +32,10 @@ class BrushfireQuerySet(QuerySet):
         self.term_vectors = None
         self.term_vector_response = None
         self.stats = None
+        self.facets = None
+        self.partial_results = False
         self.allow_non_model_fields = allow_non_model_fields
+        self._num_found = None
 
     def sort(self, *fields):
         return self.order_by(*fields)
@@ -32,6 +44,24 @@ class BrushfireQuerySet(QuerySet):
         self.query.set_handler(handler)
         return self
 
+    def time_allowed(self, ms):
+        """
+        Let solr spend at most `ms` milliseconds searching (timeAllowed). If
+        it runs out, the results are what it found so far and
+        partial_results is set on the evaluated queryset.
+        """
+        clone = self._clone()
+        clone.query.set_time_allowed(ms)
+        return clone
+
+    def nocache(self):
+        """
+        Bypass the configured query cache for this queryset
+        """
+        clone = self._clone()
+        clone.query.set_use_cache(False)
+        return clone
+
     def order_by(self, *fields):
         assert self.query.can_filter(), \
                 "Cannot filter a query once a slice has been taken."
@@ -40,7 +70,12 @@ class BrushfireQuerySet(QuerySet):
         return clone
 
     def count(self):
-        return self.query.get_count()
+        if self._num_found is None:
+            self._num_found = self.query.get_count()
+        return self._num_found
+
+    def exists(self):
+        return self.count() > 0
 
     def __len__(self):
         return self.count()
@@ -85,7 +120,95 @@ class BrushfireQuerySet(QuerySet):
             clone.query.add_stats_facets(*kwargs.get('facet'))
         return clone
 
-    def annotate(self, **kwargs):
+    def collapse(self, field, sort=None, expand=None, null_policy=None):
+        """
+        Collapse the results on `field` with {!collapse}, keeping one document
+        per group (the best scoring one, or the first by `sort`, eg. '-date').
+        Without expand this yields the group heads; with expand=N it yields
+        Group objects carrying up to N more hits of each group.
+        """
+        clone = self._clone(BrushfireExpandedQuerySet if expand else None)
+        clone.query.set_collapse(field, sort, expand, null_policy)
+        return clone
+
+    def group_by(self, field, limit=1, sort=None):
+        """
+        Group the results on `field` (group=true). Yields Group objects with
+        up to `limit` hits each, ordered by `sort`; slicing and count() apply
+        to groups rather than documents.
+        """
+        clone = self._clone(BrushfireGroupedQuerySet)
+        clone.query.set_group(field, limit, sort)
+        return clone
+
+    def export(self, *fields):
+        """
+        Dump the whole result set through solr's /export handler, yielding a
+        tuple of `fields` (default: every model field) per document. Documents
+        are parsed off the socket one at a time, so memory use stays constant
+        however many there are. Fields and ordering (default: the primary
+        key) must be docValues fields. Requires the ijson package.
+        """
+        if not fields:
+            fields = [f.name for f in self.model._meta.fields if f.name != 'score']
+        fields = list(fields)
+        docs = conf.solr_connection.export(
+            self.query.get_querystring(),
+            fields,
+            self.query.ordering or [self.model._meta.pk.name],
+            fq=self.query.get_querystring(property='fq'),
+            frange=self.query.frange,
+            handler=conf.get('handlers.export', False, 'export'),
+        )
+        return self._export_rows(docs, fields)
+
+    def _export_rows(self, docs, fields):
+        decode = get_hydrator(self.model, fields).decode
+        for doc in docs:
+            decode([doc])
+            yield tuple([doc.get(f) for f in fields])
+
+    def json_facet(self, **facets):
+        """
+        Add JSON Facet API facets (see brushfire.facets), eg.
+        qs.json_facet(by_state=Terms('state', facets={'age': Avg('age')}))
+        """
+        clone = self._clone()
+        clone.query.add_json_facets(as_json(facets))
+        return clone
+
+    def get_json_facets(self):
+        """
+        Returns the json.facet response, fetched with rows=0 if the queryset
+        hasn't been evaluated
+        """
+        if self.facets is None:
+            q = self.query.clone()
+            q.set_limits(high=0)
+            self._cache_response(q.run(), updateonly='facets')
+        return self.facets or {}
+
+    def aggregate(self, *args, **kwargs):
+        """
+        Compute brushfire.facets aggregates over the whole result set in one
+        rows=0 json.facet request.
+
+        >>> People.objects.aggregate(Sum('weight_lbs'), oldest=Max('age'))
+        {'weight_lbs__sum': 1234567.0, 'oldest': 99}
+        """
+        aggregates = named_aggregates(args, kwargs)
+        q = self.query.clone()
+        q.set_limits(high=0)
+        q.add_json_facets(as_json(dict(aggregates)))
+        results = q.run()
+        self._cache_num_found(results)
+        bucket = results.get('facets') or {'count': self._num_found or 0}
+        return aggregate_values(bucket, aggregates)
+
+    def annotate(self, *args, **kwargs):
+        if args or any(isinstance(v, Aggregate) for v in kwargs.values()):
+            raise BrushfireException("annotate() with aggregates requires values(), "
+                    "eg. qs.values('state').annotate(Count('pk'))")
         clone = self._clone()
         clone.allow_non_model_fields = True
         clone.query.add_annotations(**kwargs)
@@ -108,6 +231,16 @@ class BrushfireQuerySet(QuerySet):
         clone.query.set_fields(*fields)
         return clone
 
+    def records(self, *fields):
+        """
+        Like values_list(), but each row is a lightweight read-only record
+        (a namedtuple) with attribute access, for listings that don't need
+        full model instances
+        """
+        clone = self._clone(BrushfireRecordQuerySet)
+        clone.query.set_fields(*fields)
+        return clone
+
     def none(self):
         return self._clone(BrushfireEmptyQuerySet)
 
@@ -122,23 +255,181 @@ class BrushfireQuerySet(QuerySet):
             self.facet_counts = results.get('facet_counts', {})
             self.term_vectors = results.get('termVectors', [])
             self.stats = results.get('stats', {})
+            self.facets = results.get('facets', {})
+        self._cache_num_found(results)
 
-    def iterator(self):
-        self._cache_response(self.query.run())
+    def _cache_num_found(self, results):
+        self._cache_partial(results)
+        try:
+            self._num_found = int(results['response']['numFound'])
+        except (KeyError, TypeError, ValueError):
+            pass
 
-        for x in self.docs.get('docs', []):
-            yield self.postprocess_result(x)
+    def _cache_partial(self, results):
+        # solr ran out of timeAllowed
+        if (results.get('responseHeader') or {}).get('partialResults'):
+            self.partial_results = True
+
+    def _extend_response(self, results):
+        """
+        Merge the docs (and term vectors) of a follow-up page into the cached
+        response
+        """
+        self._cache_partial(results)
+        response = results.get('response', {})
+        self.docs.setdefault('docs', []).extend(response.get('docs', []))
+        if self.term_vectors:
+            self.term_vectors.extend(results.get('termVectors', [])[2:])
+            self.term_vector_response = None
+
+    def iterator(self, chunk_size=None):
+        if chunk_size is not None:
+            return self.stream(chunk_size)
+        return self._iterator()
+
+    def stream(self, chunk_size=None):
+        """
+        Iterate over the whole result set chunk_size documents at a time using
+        Solr's cursorMark. Pages are not kept around once their documents have
+        been yielded, so memory use stays flat on very large result sets.
+        """
+        for response in self.query.cursor(chunk_size or self.query.fetch_rows):
+            self._cache_num_found(response)
+            docs = self.get_hydrator().decode(response['response']['docs'])
+            for x in docs:
+                yield self.postprocess_result(x)
+
+    def incremental(self):
+        """
+        Parse responses incrementally: each document is read off the socket
+        and hydrated on its own, so iterating over qs.incremental().iterator()
+        holds one document in memory at a time instead of the whole response.
+        Requires the ijson package.
+        """
+        clone = self._clone()
+        clone.query.set_streaming(True)
+        return clone
+
+    def _streaming_iterator(self, timings):
+        query = self.query
+        fetched = 0
+        while True:
+            response = query.run(timings)
+            decode = self.get_hydrator().decode
+            for x in response:
+                fetched += 1
+                start = time()
+                decode([x])
+                obj = self.postprocess_result(x)
+                timings.add('hydrate', start)
+                yield obj
+            self._cache_response(response.data, updateonly=['facet_counts', 'stats'])
+            self._cache_num_found(response.data)
+            if self.query.high_mark is not None or self._num_found is None:
+                break
+            remaining = self._num_found - (self.query.start() + fetched)
+            if remaining <= 0:
+                break
+            query = self.query.clone()
+            query.set_limits(fetched, fetched + remaining)
+
+    def _iterator(self):
+        timings = QueryTimings()
+        try:
+            if self.query.streaming:
+                for x in self._streaming_iterator(timings):
+                    yield x
+                return
+
+            self._cache_response(self.query.run(timings))
+            fetched = len(self.docs.get('docs', []))
+
+            if self.query.high_mark is None and self._num_found is not None:
+                remaining = self._num_found - (self.query.start() + fetched)
+                if remaining > 0:
+                    q = self.query.clone()
+                    q.set_limits(fetched, fetched + remaining)
+                    self._extend_response(q.run(timings))
+
+            with timings.phase('hydrate'):
+                docs = self.get_hydrator().decode(self.docs.get('docs', []))
+            for x in docs:
+                start = time()
+                obj = self.postprocess_result(x)
+                timings.add('hydrate', start)
+                yield obj
+        finally:
+            timings.finish(self.model, self.query)
+
+    def _submit(self, fn, *args, **kwargs):
+        solr = conf.solr_connection
+        if not hasattr(solr, 'submit'):
+            raise BrushfireException("Asynchronous evaluation requires an "
+                    "asynchronous driver such as AsyncSolr")
+        return solr.submit(fn, *args, **kwargs)
+
+    def afetch(self):
+        """
+        Evaluate the queryset in the background. Returns a Future that
+        resolves to the list of results; the queryset's result cache is
+        filled as well.
+        """
+        def fetch():
+            self._fetch_all()
+            return self._result_cache
+        return self._submit(fetch)
+
+    def acount(self):
+        """
+        Returns a Future that resolves to count()
+        """
+        return self._submit(self.count)
+
+    def prepare(self):
+        """
+        Compile this queryset into a PreparedQuery template. Filter values
+        given as P('name') placeholders are filled in later by bind().
+        """
+        return PreparedQuery(self)
+
+    def bulk_add(self, objs, batch_size=500, commit_within=None, workers=1,
+            core=DEFAULT):
+        """
+        Index an iterable of model instances, batch_size documents per
+        request. With workers > 1, that many batches are sent in parallel.
+        Returns the number of documents sent.
+        """
+        solr = conf.solr_connection
+
+        def send(batch):
+            solr.add([obj.to_document() for obj in batch], core=core,
+                    commit_within=commit_within)
+            return len(batch)
+
+        batches = chunked(objs, batch_size)
+        sent = 0
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                while True:
+                    window = list(islice(batches, workers))
+                    if not window:
+                        break
+                    sent += sum(pool.map(send, window))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for batch in batches:
+                sent += send(batch)
+        return sent
 
     def get_facet_counts(self):
         if not self.facet_counts:
             q = self.query.clone()
-            q.set_limits(high=1)
-            self._cache_response(q.run())
-        ret = {}
-        ff = self.facet_counts.get('facet_fields', {})
-        for key in ff.keys():
-            ret[key] = OrderedDict(zip(ff[key][::2], ff[key][1::2]))
-        return ret
+            q.set_limits(high=0)
+            self._cache_response(q.run(), updateonly='facet_counts')
+        return parse_facet_counts(self.facet_counts)
 
     def get_term_vectors(self):
         """
@@ -173,41 +464,61 @@ class BrushfireQuerySet(QuerySet):
             q = self.query.clone()
             q.set_limits(high=0)
             self._cache_response(q.run(), updateonly='stats')
-        stats = {}
-        for field in self.stats['stats_fields'].keys():
-            try:
-                stats[field] = Stats(field, **self.stats['stats_fields'][field])
-            except:
-                # there were no stats for the field
-                pass
-        return stats
+        return parse_stats(self.stats)
+
+    def summary(self, count=True, facets=[], stats=[], stats_facets=[]):
+        """
+        Fetch numFound, facet counts and stats for this queryset in a single
+        rows=0 request, without downloading any documents. Fields listed in
+        facets/stats are requested in addition to any already on the
+        queryset.
+
+        >>> People.objects.filter(age__gte=30).summary(facets=['name'], stats=['age'])
+        {'count': 1234, 'facets': {'name': {...}}, 'stats': {'age': <Stats>}}
+        """
+        q = self.query.clone()
+        q.set_limits(high=0)
+        if facets:
+            q.add_facets(*[f for f in facets if f not in q.facets])
+        if stats:
+            q.add_stats(*[f for f in stats if f not in q.stats])
+        if stats_facets:
+            q.add_stats_facets(*[f for f in stats_facets if f not in q.stats_facets])
+        results = q.run()
+        self._cache_num_found(results)
+        summary = {}
+        if count:
+            summary['count'] = self._num_found
+        if q.facets:
+            summary['facets'] = parse_facet_counts(results.get('facet_counts', {}))
+        if q.stats:
+            summary['stats'] = parse_stats(results.get('stats', {}))
+        if q.json_facets:
+            summary['json_facets'] = results.get('facets', {})
+        return summary
+
+    def get_hydrator(self):
+        # self.term_vectors implys allow_non_model_fields
+        allow = bool(self.allow_non_model_fields or self.term_vectors)
+        cached = self.__dict__.get('_hydrator')
+        if cached is None or cached[0] != allow:
+            cached = self._hydrator = (allow,
+                    get_hydrator(self.model, self.query.fields, allow))
+        return cached[1]
 
     def postprocess_result(self, result):
         """
         This function takes the data from solr and turns it into a set of model objects
         """
-        pk = self.query.get_meta().pk.column
-        keys = set(['foo'] + [x.name for x in self.query.get_meta().fields]) & set(result.keys())
-        r = {k:result[k] for k in keys}
-        r['pk'] = r[pk]
-        model = self.model(**r)
-        if self.allow_non_model_fields or self.term_vectors:
-            # self.term_vectors implys allow_non_model_fields
-            #m = ModelLookalikeObject()
-            model.__dict__.update(model.__dict__)
-            nmf = set(result.keys()) - set(['foo'] + [x.name for x in self.query.get_meta().fields])
-            r = {k:result[k] for k in nmf}
-            model.__dict__.update(r)
-            model.pk = model.pk
-            #model = m
-            if self.term_vectors:
-                if not self.term_vector_response:
-                    self.get_term_vectors()
-                tv = self.term_vector_response
-                if tv.get(model.pk, None):
-                    model.__dict__.update({'_term_vectors': tv.get(model.pk)})
-                else:
-                    model.__dict__.update({'_term_vectors': {}})
+        model = self.get_hydrator()(result)
+        if self.term_vectors:
+            if not self.term_vector_response:
+                self.get_term_vectors()
+            tv = self.term_vector_response
+            if tv.get(model.pk, None):
+                model.__dict__.update({'_term_vectors': tv.get(model.pk)})
+            else:
+                model.__dict__.update({'_term_vectors': {}})
         return model
 
     def narrow_group(self, key, values, connector='OR'):
@@ -314,6 +625,58 @@ class BrushfireValuesQuerySet(BrushfireQuerySet):
     def postprocess_result(self, result):
         return SortedDict(filter(lambda x: x[0] in self.query.fields and x[0] != 'score', result.items()))
 
+    def annotate(self, *args, **kwargs):
+        if args or any(isinstance(v, Aggregate) for v in kwargs.values()):
+            return self._clone(BrushfireGroupedValuesQuerySet,
+                    aggregates=named_aggregates(args, kwargs))
+        return super(BrushfireValuesQuerySet, self).annotate(**kwargs)
+
+class BrushfireGroupedValuesQuerySet(BrushfireValuesQuerySet):
+    """
+    values(*fields).annotate(*aggregates): one row per distinct combination of
+    the values() fields, worked out by solr with nested terms facets in a
+    single rows=0 request
+    """
+    aggregates = ()
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('aggregates', self.aggregates)
+        return super(BrushfireGroupedValuesQuerySet, self)._clone(klass, setup, **kwargs)
+
+    def group_fields(self):
+        return [f for f in self.query.fields if f not in ('*', 'score')]
+
+    def count(self):
+        return len(list(self._iterator()))
+
+    def _iterator(self):
+        fields = self.group_fields()
+        facet = as_json(dict(self.aggregates))
+        for name in reversed(fields):
+            facet = {name: Terms(name, limit=-1, facets=facet).as_json()}
+        q = self.query.clone()
+        q.clear_limits()
+        q.set_limits(high=0)
+        q.clear_json_facets().add_json_facets(facet)
+        results = q.run()
+        self._cache_num_found(results)
+        rows = self._flatten(results.get('facets') or {}, fields, SortedDict())
+        for row in islice(rows, self.query.low_mark, self.query.high_mark):
+            yield row
+
+    def _flatten(self, bucket, fields, row):
+        if not fields:
+            values = aggregate_values(bucket, self.aggregates)
+            for alias, _ in self.aggregates:
+                row[alias] = values[alias]
+            yield row
+            return
+        for b in bucket.get(fields[0], {}).get('buckets', []):
+            r = SortedDict(row)
+            r[fields[0]] = b['val']
+            for x in self._flatten(b, fields[1:], r):
+                yield x
+
 class BrushfireValuesListQuerySet(BrushfireValuesQuerySet):
     def postprocess_result(self, result):
         return super(BrushfireValuesListQuerySet, self)\
@@ -329,17 +692,102 @@ class BrushfireValuesObjectQuerySet(BrushfireValuesQuerySet):
                 self.__dict__.update(dct)
         return DictObject(d)
 
+class BrushfireRecordQuerySet(BrushfireQuerySet):
+    def postprocess_result(self, result):
+        cls = self.__dict__.get('_record_class')
+        if cls is None:
+            names = []
+            for f in self.query.fields:
+                f = f.split(':')[0]
+                if f not in names:
+                    names.append(f)
+            cls = self._record_class = get_record_class(self.model, names)
+        return cls(*map(result.get, cls._fields))
+
+class BrushfireExpandedQuerySet(BrushfireQuerySet):
+    """
+    A collapsed queryset with expand: each result is a Group headed by the
+    collapsed document
+    """
+    expanded = None
+
+    def _cache_response(self, results, updateonly=[]):
+        super(BrushfireExpandedQuerySet, self)._cache_response(results, updateonly)
+        if not updateonly:
+            self.expanded = results.get('expanded', {})
+
+    def _extend_response(self, results):
+        super(BrushfireExpandedQuerySet, self)._extend_response(results)
+        self.expanded.update(results.get('expanded', {}))
+
+    def postprocess_result(self, result):
+        head = super(BrushfireExpandedQuerySet, self).postprocess_result(result)
+        value = result.get(self.query.collapse['field'])
+        expanded = (self.expanded or {}).get(unicode(value), {})
+        docs = self.get_hydrator().decode(expanded.get('docs', []))
+        hits = [head] + [super(BrushfireExpandedQuerySet, self).postprocess_result(x)
+                for x in docs]
+        return Group(value, expanded.get('numFound', 0) + 1, hits)
+
+class BrushfireGroupedQuerySet(BrushfireQuerySet):
+    """
+    A group_by() queryset: results are Group objects and counts are in
+    groups (ngroups)
+    """
+    def _grouped(self, results):
+        return results.get('grouped', {}).get(self.query.group['field'], {})
+
+    def _cache_num_found(self, results):
+        self._cache_partial(results)
+        try:
+            self._num_found = int(self._grouped(results)['ngroups'])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def count(self):
+        if self._num_found is None:
+            q = self.query.clone()
+            q.set_limits(high=0)
+            self._cache_num_found(q.run())
+        return self._num_found or 0
+
+    def _iterator(self):
+        results = self.query.run()
+        self._cache_response(results, updateonly=['facet_counts', 'stats'])
+        groups = self._grouped(results).get('groups', [])
+        fetched = len(groups)
+
+        if self.query.high_mark is None and self._num_found is not None:
+            remaining = self._num_found - (self.query.start() + fetched)
+            if remaining > 0:
+                q = self.query.clone()
+                q.set_limits(fetched, fetched + remaining)
+                groups = groups + self._grouped(q.run()).get('groups', [])
+
+        hydrator = self.get_hydrator()
+        for group in groups:
+            doclist = group.get('doclist', {})
+            docs = hydrator.decode(doclist.get('docs', []))
+            yield Group(group.get('groupValue'), doclist.get('numFound', 0),
+                    [self.postprocess_result(x) for x in docs])
+
 class BrushfireEmptyQuerySet(BrushfireQuerySet):
     def __len__(self):
         return 0
 
+    def count(self):
+        return 0
+
+    def summary(self, count=True, facets=[], stats=[], stats_facets=[]):
+        return {'count': 0} if count else {}
+
     def _cache_response(self, results, updateonly=[]):
         self.docs = {}
         self.facet_counts = {}
         self.term_vectors = []
         self.stats = {}
 
-    def iterator(self):
+    def iterator(self, chunk_size=None):
         self._cache_response(None)
         for x in []:
             yield self.postprocess_result(x)
@@ -349,6 +797,79 @@ class BrushfireEmptyQuerySet(BrushfireQuerySet):
 #                                   Helpers
 #
 ################################################################################
+class PreparedQuery(object):
+    """
+    A compiled queryset template.
+
+    >>> by_name = People.objects.filter(name=P('name'), age__gte=P('min_age')).prepare()
+    >>> list(by_name.bind(name='Bob', min_age=60))
+
+    The q/fq strings and the parameter layout are built once, here. bind()
+    only fills in the placeholder values (as Solr macro parameters) and
+    returns a queryset ready to be evaluated.
+    """
+    def __init__(self, queryset):
+        self.queryset = queryset._clone()
+        self.placeholders = self.queryset.query.compile()
+
+    def bind(self, **values):
+        missing = self.placeholders - set(values)
+        if missing:
+            raise BrushfireException("Missing values for placeholders: %s" %
+                    ', '.join(sorted(missing)))
+        unknown = set(values) - self.placeholders
+        if unknown:
+            raise BrushfireException("Unknown placeholders: %s" %
+                    ', '.join(sorted(unknown)))
+        clone = self.queryset._clone()
+        clone.query.bind(values)
+        return clone
+
+def parse_facet_counts(facet_counts):
+    ret = {}
+    ff = (facet_counts or {}).get('facet_fields', {})
+    for key in ff.keys():
+        ret[key] = OrderedDict(zip(ff[key][::2], ff[key][1::2]))
+    return ret
+
+def parse_stats(results):
+    stats = {}
+    fields = (results or {}).get('stats_fields') or {}
+    for field in fields.keys():
+        try:
+            stats[field] = Stats(field, **fields[field])
+        except:
+            # there were no stats for the field
+            pass
+    return stats
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+class Group(object):
+    """
+    One group of a grouped or expanded result: the group's value, the number
+    of documents in it and the hits returned for it
+    """
+    def __init__(self, value, count, hits):
+        self.value = value
+        self.count = count
+        self.hits = hits
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def __len__(self):
+        return len(self.hits)
+
+    def __repr__(self):
+        return "<Group %r: %d of %d hits>" % (self.value, len(self.hits), self.count)
+
 class Stats(object):
     def __init__(self, name, min, max, count, missing, sum, sumOfSquares, mean, stddev, facets={}):
         self.name = name
@@ -369,3 +890,45 @@ class Stats(object):
                     self.facets[facet_field] = {}
                     self.facets[facet_field][facet] = Stats(facet, **facets[facet_field][facet])
 
+
+################################################################################
+#
+#                             Concurrent evaluation
+#
+################################################################################
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+def _get_search_pool():
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPool(conf.get('connection.pool_size', False, 10))
+    return _search_pool
+
+def _fetch(qs):
+    qs._fetch_all()
+    return qs
+
+def multi_search(*querysets):
+    """
+    Evaluate several querysets at the same time and fill each one's result
+    cache, so the total wait is that of the slowest query rather than the sum
+    of all of them. Uses the driver's executor when an asynchronous driver is
+    configured, and a bounded thread pool otherwise.
+
+    >>> results, sidebar = multi_search(People.objects.filter(name='Bob'),
+    ...                                 People.objects.order_by('-age')[:5])
+    """
+    pending = [qs for qs in querysets if qs._result_cache is None]
+    if len(pending) == 1:
+        _fetch(pending[0])
+    elif pending:
+        if hasattr(conf.solr_connection, 'submit'):
+            for future in [conf.solr_connection.submit(_fetch, qs) for qs in pending]:
+                future.result()
+        else:
+            _get_search_pool().map(_fetch, pending)
+    return list(querysets)
+
+evaluate_all = multi_search
@@ -1,6 +1,6 @@
 from django.conf import settings
 from brushfire.core.exceptions import BrushfireConfigException
-from django.utils.importlib import import_module
+from brushfire.utils import import_class
 
 conf = getattr(settings, 'BRUSHFIRE', None)
 if conf is None:
@@ -8,11 +8,54 @@ if conf is None:
 
 """
 BRUSHFIRE = {
-    'host': 'http://localhost:8080/solr',
+    'host': 'http://localhost:8080/solr', # or a list of replicas, the first is the primary
+    'balancer': { # only used with a list of hosts
+        'strategy': 'least_outstanding', # or 'latency'
+        'eject_after': 3, # consecutive failures before a replica is left out
+        'eject_for': 30, # seconds
+        'health_interval': 10, # seconds between health checks, 0 disables them
+        'ping': 'collection1/admin/ping', # default: <query core>/admin/ping
+    },
+    'timeouts': { # seconds, None waits forever
+        'connect': 5,
+        'read': 60,
+        'handlers': {
+            'mlt': {'read': 120}, # per-handler overrides
+            'optimize': {'read': 3600}, # the solrindex command's optimize
+        },
+    },
+    'retry': {
+        'retries': 1, # extra attempts for failed searches (on another replica if possible)
+        'backoff': 0.05, # seconds, doubled every attempt and jittered
+    },
+    'hedge': { # hedged requests, off unless percentile is set
+        'percentile': 95, # duplicate a search once it is slower than this
+        'window': 200, # latencies kept per handler
+        'min_samples': 20,
+    },
+    'driver': 'brushfire.core.driver.asyncsolr.AsyncSolr', # default: Solr
+    'driver_options': { # extra keyword arguments for the driver class
+        'workers': 50, # AsyncSolr: searches in flight; default: connection.pool_size
+    },
+    'codec': {
+        'name': 'javabin', # default: json, or the path to a Codec subclass
+        'json_backend': 'ujson', # or simplejson or json; default: the fastest installed
+    },
     'cache': {
-        'method': 'file', # or django
+        'method': 'file', # or django, or the path to a QueryCache subclass
         'path': '/tmp/.cache', # if file
         'prefix': 'solrcache', # if django
+        'which': 'default', # if django
+        'timeout': 300, # seconds
+        'max_entries': 1000,
+        'handlers': {
+            'mlt': 0, # per-handler timeouts, 0 disables caching
+        },
+    },
+    'connection': {
+        'pool_size': 10, # number of keep-alive sessions kept around
+        'max_connections': 10, # per-host connections per session
+        'keepalive': 60, # seconds an idle session may be reused
     },
     'cores': {
         'query': 'collection1',
@@ -21,6 +64,7 @@ BRUSHFIRE = {
     },
     'handlers': {
         'default': 'edismax',
+        'export': 'export', # used by qs.export()
         'custom': {
             'typename': 'handlername',
             'typename2': 'handlername2',
@@ -28,18 +72,33 @@ BRUSHFIRE = {
         },
     },
     'index': {
-        'method': 'dih', # or 'document add' -- not sure about this name
+        'method': 'dih', # or 'orm'
         'dih': {
             'handler': '/dataimport',
             'command': 'full-import',
             'clear': True,
             'swap_cores_on_complete': 'othercore',
+            'timeout': 7200, # seconds, abort the import after this long
+        },
+        'orm': {
+            'model': 'app.models.People', # brushfire model
+            'queryset': 'app.search.people_queryset', # callable returning a django QuerySet
+            'transform': 'app.search.person_to_doc', # optional, obj -> dict
+            'core': 'collection2',
+            'chunk_size': 10000, # primary keys per worker chunk
+            'batch_size': 1000, # documents per update request
+            'workers': 4,
+            'throttle': 0, # max docs/sec, 0 for unthrottled
+            'checkpoint': '/tmp/brushfire-reindex.json',
+            'swap_cores_on_complete': 'othercore',
         },
     },
     'query': {
         'fields': '*,score',
         'lparams': "{!edismax qf='text^2 name^100' bf='name'}",
         'rows': 20,
+        'fetch_rows': 1000, # first page size for unsliced querysets
+        'time_allowed': 2000, # ms, solr's timeAllowed; default: no limit
     },
 }
 """
@@ -52,19 +111,82 @@ class Configuration(object):
         self.__set('default_handler', 'handlers.default', False, 'select') 
         self.__set('default_lparams', 'query.lparams', False, '') 
         self.set_query_cache()
+        self.set_connection_pool()
+        self.set_replicas()
+        self.set_hedger()
+        self.set_codec()
 
     def set_query_cache(self):
+        from brushfire.core.cache import FileQueryCache, DjangoQueryCache
         c = self.get('cache.method', False)
         if c is None:
             self.query_cache = None
         else:
+            options = {
+                'timeout': self.get('cache.timeout', False, 300),
+                'handlers': self.get('cache.handlers', False, {}),
+                'max_entries': self.get('cache.max_entries', False, 1000),
+            }
             if c not in ('file', 'django'):
-                self.query_cache = import_module(c)()
+                self.query_cache = import_class(c)(**options)
             elif c == 'file':
-                self.query_cache = self.get('cache.path')
+                self.query_cache = FileQueryCache(self.get('cache.path'), **options)
             elif c == 'django':
                 from django.core.cache import get_cache
-                self.query_cache = get_cache(self.get('cache.which', False, 'default'))
+                self.query_cache = DjangoQueryCache(
+                        get_cache(self.get('cache.which', False, 'default')),
+                        prefix=self.get('cache.prefix', False, 'solrcache'),
+                        **options)
+
+    def set_connection_pool(self):
+        from brushfire.core.driver.solr import SessionPool
+        self.connection_pool = SessionPool(
+            size=self.get('connection.pool_size', False, 10),
+            max_connections=self.get('connection.max_connections', False, 10),
+            keepalive=self.get('connection.keepalive', False, 60),
+        )
+
+    def set_replicas(self):
+        """
+        A list of hosts sets up client-side load balancing over them; `host`
+        becomes the first one, which indexing and admin requests use
+        """
+        if not isinstance(self.host, (list, tuple)):
+            self.replicas = None
+            return
+        from brushfire.core.driver.balancer import ReplicaSet
+        hosts = list(self.host)
+        self.host = hosts[0]
+        self.replicas = ReplicaSet(hosts, self.connection_pool,
+            strategy=self.get('balancer.strategy', False, 'least_outstanding'),
+            eject_after=self.get('balancer.eject_after', False, 3),
+            eject_for=self.get('balancer.eject_for', False, 30),
+            health_interval=self.get('balancer.health_interval', False, 10),
+            ping_path=self.get('balancer.ping', False,
+                '%s/admin/ping' % self.query_core if self.query_core else 'admin/ping'),
+        )
+
+    def set_hedger(self):
+        percentile = self.get('hedge.percentile', False)
+        if not percentile:
+            self.hedger = None
+            return
+        from brushfire.core.driver.hedging import Hedger
+        self.hedger = Hedger(percentile,
+            window=self.get('hedge.window', False, 200),
+            min_samples=self.get('hedge.min_samples', False, 20),
+        )
+
+    def set_codec(self):
+        from brushfire.core.driver.codecs import get_codec
+        name = self.get('codec.name', False, 'json')
+        options = {}
+        if name == 'json':
+            options['backend'] = self.get('codec.json_backend', False)
+        try:
+            self.codec = get_codec(name, **options)
+        except ValueError as e:
+            raise BrushfireConfigException(str(e))
 
     def __set(self, property, dict_key=None, required=True, default=None):
         if dict_key is None:
@@ -107,6 +229,18 @@ class Configuration(object):
             cache=self.query_cache,
 	        fields=self.get('query.fields', False, '*,score'),
             rows=self.get('query.rows', False, 20),
+            pool=self.connection_pool,
+            replicas=self.replicas,
+            timeouts={
+                'connect': self.get('timeouts.connect', False, 5),
+                'read': self.get('timeouts.read', False, 60),
+                'handlers': self.get('timeouts.handlers', False, {}),
+            },
+            retries=self.get('retry.retries', False, 1),
+            backoff=self.get('retry.backoff', False, 0.05),
+            hedger=self.hedger,
+            codec=self.codec,
+            **self.get('driver_options', False, {})
         )
         return self.solr_conn
 
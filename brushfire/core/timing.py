@@ -0,0 +1,58 @@
+from time import time
+from contextlib import contextmanager
+
+from brushfire.signals import query_finished
+
+class QueryTimings(object):
+    """
+    Milliseconds spent in each phase of evaluating a query:
+
+        build    compiling the query string and request parameters
+        network  waiting on solr, from sending the request to reading the body
+        qtime    solr's own QTime (part of network)
+        decode   parsing response bodies
+        hydrate  turning documents into model instances or rows
+
+    `requests` has one entry per request sent (or answered from the cache).
+    """
+    PHASES = ('build', 'network', 'qtime', 'decode', 'hydrate')
+
+    def __init__(self):
+        self.phases = dict.fromkeys(self.PHASES, 0.0)
+        self.requests = []
+        self.started = time()
+        self.total = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time()
+        try:
+            yield
+        finally:
+            self.phases[name] += (time() - start) * 1000
+
+    def add(self, name, start):
+        """
+        Add the time since `start` (a time() value) to phase `name`
+        """
+        self.phases[name] += (time() - start) * 1000
+
+    def add_request(self, url, network, decode, qtime, cached=False):
+        self.phases['network'] += network
+        self.phases['decode'] += decode
+        self.phases['qtime'] += qtime
+        self.requests.append({
+            'url': url.humanize(),
+            'network': network,
+            'decode': decode,
+            'qtime': qtime,
+            'cached': cached,
+        })
+
+    def finish(self, sender, query):
+        self.total = (time() - self.started) * 1000
+        query_finished.send(sender=sender, query=query, timings=self)
+
+    def __repr__(self):
+        return "<QueryTimings %s>" % ' '.join(
+                "%s=%.1fms" % (p, self.phases[p]) for p in self.PHASES)
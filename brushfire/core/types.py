@@ -1,5 +1,7 @@
 import json
 
+from brushfire.utils import smart_quote_string
+
 class FRange(object):
     qid = 0
 
@@ -72,3 +74,37 @@ class GroupedFRange(object):
         for f in data['franges']:
             s.add_frange(f['func'], l=f['l'], u=f['u'])
         return s
+
+class P(object):
+    """
+    A named placeholder for a filter value in a prepared query, eg.
+    People.objects.filter(name=P('name')).prepare().bind(name='Bob')
+
+    Placeholders are rendered as Solr macros (${bfp_name}) and filled in with
+    request parameters, so the q and fq strings stay identical across bind()
+    calls. Bind a list for __in lookups.
+    """
+    prefix = 'bfp_'
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def param(self):
+        return self.prefix + self.name
+
+    def __str__(self):
+        return '${%s}' % self.param
+
+    def __repr__(self):
+        return 'P(%r)' % self.name
+
+    @staticmethod
+    def encode(value):
+        if isinstance(value, (list, tuple, set)):
+            return u' OR '.join([smart_quote_string(unicode(x)) for x in value])
+        if not isinstance(value, basestring):
+            value = str(value)
+        if value.find(' ') != -1:
+            value = smart_quote_string(value)
+        return value
@@ -0,0 +1,164 @@
+"""
+Builders for Solr's JSON Facet API (json.facet).
+
+    >>> from brushfire import facets as jf
+    >>> People.objects.json_facet(
+    ...     by_state=jf.Terms('state', limit=10, facets={
+    ...         'avg_age': jf.Avg('age'),
+    ...         'ages': jf.Range('age', start=0, end=100, gap=10),
+    ...     }),
+    ...     seniors=jf.Query('age:[65 TO *]'),
+    ...     weight=jf.Sum('weight_lbs'),
+    ... ).get_json_facets()
+
+Aggregates double as django-style aggregate()/annotate() arguments::
+
+    >>> People.objects.aggregate(jf.Sum('weight_lbs'), jf.Avg('age'))
+    {'weight_lbs__sum': 1234567.0, 'age__avg': 41.2}
+    >>> People.objects.values('state').annotate(jf.Count('pk'))
+"""
+import json
+
+from brushfire.core.exceptions import BrushfireException
+
+class Facet(object):
+    """
+    A bucketing facet. Options are passed through to solr as-is; nested
+    sub-facets (facets or aggregates) go in `facets`.
+    """
+    type = None
+
+    def __init__(self, facets=None, **options):
+        self.facets = dict(facets or {})
+        self.options = options
+
+    def facet(self, **facets):
+        self.facets.update(facets)
+        return self
+
+    def as_json(self):
+        d = {'type': self.type}
+        d.update((k, v) for k, v in self.options.items() if v is not None)
+        if self.facets:
+            d['facet'] = as_json(self.facets)
+        return d
+
+class Terms(Facet):
+    type = 'terms'
+
+    def __init__(self, field, limit=None, sort=None, mincount=None, facets=None, **options):
+        super(Terms, self).__init__(facets, field=field, limit=limit, sort=sort,
+                mincount=mincount, **options)
+
+class Range(Facet):
+    type = 'range'
+
+    def __init__(self, field, start, end, gap, facets=None, **options):
+        super(Range, self).__init__(facets, field=field, start=start, end=end,
+                gap=gap, **options)
+
+class Query(Facet):
+    type = 'query'
+
+    def __init__(self, q, facets=None, **options):
+        super(Query, self).__init__(facets, q=unicode(q), **options)
+
+class Aggregate(object):
+    """
+    A facet function, eg. sum(weight_lbs)
+    """
+    function = None
+
+    def __init__(self, field):
+        self.field = field
+
+    @property
+    def default_alias(self):
+        return '%s__%s' % (self.field, self.function)
+
+    def as_json(self):
+        return '%s(%s)' % (self.function, self.field)
+
+class Sum(Aggregate):
+    function = 'sum'
+
+class Avg(Aggregate):
+    function = 'avg'
+
+class Min(Aggregate):
+    function = 'min'
+
+class Max(Aggregate):
+    function = 'max'
+
+class Unique(Aggregate):
+    function = 'unique'
+
+class Percentile(Aggregate):
+    function = 'percentile'
+
+    def __init__(self, field, *percentiles):
+        super(Percentile, self).__init__(field)
+        self.percentiles = percentiles or (50,)
+
+    def as_json(self):
+        return 'percentile(%s,%s)' % (self.field, ','.join(str(p) for p in self.percentiles))
+
+class Count(Aggregate):
+    """
+    Count('pk') (or '*') is the bucket's document count, which solr returns
+    with every bucket anyway. Count(field, distinct=True) is unique(field).
+    """
+    function = 'count'
+
+    def __init__(self, field='*', distinct=False):
+        super(Count, self).__init__(field)
+        self.distinct = distinct
+
+    @property
+    def is_bucket_count(self):
+        return not self.distinct
+
+    def as_json(self):
+        if self.distinct:
+            return 'unique(%s)' % self.field
+        return None
+
+def as_json(facets):
+    """
+    Turn a {name: Facet/Aggregate/dict/str} mapping into the structure sent
+    as json.facet
+    """
+    out = {}
+    for name, f in facets.items():
+        if hasattr(f, 'as_json'):
+            f = f.as_json()
+        if f is not None:
+            out[name] = f
+    return out
+
+def dumps(facets):
+    return json.dumps(as_json(facets)) if facets else None
+
+def named_aggregates(args, kwargs):
+    """
+    Returns [(alias, Aggregate)] for aggregate()/annotate() style arguments
+    """
+    named = [(a.default_alias, a) for a in args]
+    named += sorted(kwargs.items())
+    for alias, agg in named:
+        if not isinstance(agg, Aggregate):
+            raise BrushfireException("%r is not an aggregate" % (agg,))
+    return named
+
+def aggregate_values(bucket, aggregates):
+    """
+    Pick the values of `aggregates` out of a facet bucket
+    """
+    values = {}
+    for alias, agg in aggregates:
+        if getattr(agg, 'is_bucket_count', False):
+            values[alias] = bucket.get('count', 0)
+        else:
+            values[alias] = bucket.get(alias)
+    return values
@@ -1,6 +1,8 @@
 from optparse import make_option
 from django.core.management.base import NoArgsCommand, CommandError
-from brushfire.management.utils import reindex
+from brushfire.management.utils import reindex, ormindex
+from brushfire.core.exceptions import BrushfireConfigException
+from brushfire.utils import import_class
 
 class Command(NoArgsCommand):
     can_import_settings = True
@@ -10,25 +12,64 @@ class Command(NoArgsCommand):
         make_option('-c', '--core', action='store'),
         make_option('-s', '--swap_core', action='store'),
         make_option('-a', '--core_admin', action='store'),
+        make_option('-R', '--resume', action='store_true', default=False,
+            help="Resume an interrupted orm reindex from its checkpoint"),
+        make_option('-t', '--timeout', action='store', type='int', default=None,
+            help="Abort a dih import that runs longer than this many seconds"),
+        make_option('--no-progress-bar', action='store_false', dest='tty',
+            default=None, help="Print one progress line per update (for CI)"),
     )
     
     def handle_noargs(self, host=None, handler=None, core=None,
-            swap_core=None, core_admin=None, **kwargs):
+            swap_core=None, core_admin=None, resume=False, timeout=None,
+            tty=None, **kwargs):
+        from brushfire.core.settings import configuration as conf
+
+        method = conf.get('index.method', False, 'dih')
+        if method == 'orm':
+            return self.handle_orm(conf, resume)
+        if method != 'dih':
+            raise CommandError, "Unknown index method: %s" % method
+
         if (None, None, None, None, None) == (host, handler, core, swap_core, core_admin):
             """
             If any args are passed, all args are required, otherwise we'll just
             use the config.
             """
-            from brushfire.core.settings import configuration as conf
-            
-            method = conf.get('index.method', 'dih')
-            if method != 'dih':
-                raise CommandError, "This command only works with the " \
-                                    "dataimporthandler (dih) index method"
-            host = conf.get('host')
-            handler = conf.get('index.dih.handler', '/dataimport')
+            host = conf.host # the primary, when replicas are configured
+            handler = conf.get('index.dih.handler', False, '/dataimport')
             core = conf.get('index.dih.core')
             swap_core = conf.get('index.dih.swap_cores_on_complete', False)
             core_admin = conf.get('cores.admin')
         
-        reindex.reindex(host, handler, core, swap_core, core_admin, self.stderr)
+        reindex.reindex(host, handler, core, swap_core, core_admin, self.stderr,
+                pool=conf.connection_pool,
+                timeout=timeout or conf.get('index.dih.timeout', False),
+                progress=reindex.ProgressReporter(self.stderr, tty=tty),
+                timeout_for=conf.solr_connection.timeout_for)
+
+    def handle_orm(self, conf, resume):
+        core = conf.get('index.orm.core', False) or conf.get('cores.index', False)
+        if not core:
+            raise BrushfireConfigException("BRUSHFIRE['index']['orm']['core'] or "
+                    "BRUSHFIRE['cores']['index'] is required for the orm index method")
+        queryset = import_class(conf.get('index.orm.queryset'))
+        if callable(queryset):
+            queryset = queryset()
+        transform = conf.get('index.orm.transform', False)
+        ormindex.reindex(
+            conf.solr_connection,
+            queryset,
+            import_class(conf.get('index.orm.model')),
+            core,
+            swap_core=conf.get('index.orm.swap_cores_on_complete', False),
+            core_admin=conf.get('cores.admin', False, 'admin/cores'),
+            transform=import_class(transform) if transform else None,
+            chunk_size=conf.get('index.orm.chunk_size', False, 10000),
+            batch_size=conf.get('index.orm.batch_size', False, 1000),
+            workers=conf.get('index.orm.workers', False, 4),
+            throttle=conf.get('index.orm.throttle', False, 0),
+            checkpoint=conf.get('index.orm.checkpoint', False),
+            resume=resume,
+            output_stream=self.stderr,
+        )
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import logging
+import threading
+from time import time, sleep
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection
+from django.db.models import Min, Max
+
+from brushfire.core.exceptions import BrushfireException
+from brushfire.management.utils.reindex import swap_cores
+
+class Throttle(object):
+    """
+    Limits the combined throughput of all workers to `rate` documents per
+    second. A rate of 0 disables throttling.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = time()
+
+    def wait(self, n):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time()
+            start = max(now, self.next_slot)
+            self.next_slot = start + float(n) / self.rate
+        if start > now:
+            sleep(start - now)
+
+class Checkpoint(object):
+    """
+    Records which primary-key chunks have been indexed into `core` so a failed
+    run can pick up where it left off. Chunks are only meaningful for the
+    chunk_size and pk bounds (`layout`) they were cut with, so those are
+    saved too.
+    """
+    def __init__(self, path, core, layout=None):
+        self.path = path
+        self.core = core
+        self.layout = layout or {}
+        self.lock = threading.Lock()
+        self.done = set()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get('core') != self.core:
+            return
+        if data.get('layout') != self.layout:
+            raise BrushfireException("Can't resume from %s: it was written for "
+                    "%r, this run has %r. Reindex without resuming." % (
+                    self.path, data.get('layout'), self.layout))
+        self.done = set(data.get('done', []))
+
+    def mark(self, chunk_start):
+        with self.lock:
+            self.done.add(chunk_start)
+            if not self.path:
+                return
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'core': self.core, 'layout': self.layout,
+                    'done': sorted(self.done)}, f)
+            os.rename(tmp, self.path)
+
+    def clear(self):
+        self.done = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def model_transform(model):
+    """
+    Default ORM -> document mapping: copy every field declared on the
+    brushfire model from the attribute of the same name on the ORM object.
+    """
+    names = [f.attname for f in model._meta.fields if f.name != 'score']
+    def transform(obj):
+        return model(**dict((n, getattr(obj, n, None)) for n in names)).to_document()
+    return transform
+
+def reindex(solr, queryset, model, core, swap_core=None, core_admin='admin/cores',
+        transform=None, chunk_size=10000, batch_size=1000, workers=4,
+        throttle=0, checkpoint=None, resume=False, output_stream=sys.stderr):
+    """
+    Index a django ORM queryset into `core`, reading it in primary-key-range
+    chunks across a pool of `workers` threads, each posting batch_size
+    documents per request. Completed chunks are recorded in the `checkpoint`
+    file; with resume=True they are skipped and the core is not cleared.
+    Resuming with a different chunk_size or pk range is refused. Primary keys
+    must be integers.
+    """
+    transform = transform or model_transform(model)
+    limiter = Throttle(throttle)
+
+    bounds = queryset.aggregate(lo=Min('pk'), hi=Max('pk'))
+    for pk in bounds.values():
+        if pk is not None and not isinstance(pk, (int, long)):
+            raise BrushfireException("The orm index method reads the queryset "
+                    "in primary key ranges and needs integer primary keys, "
+                    "got %r" % pk)
+
+    ckpt = Checkpoint(checkpoint, core, layout={'chunk_size': chunk_size,
+            'lo': bounds['lo'], 'hi': bounds['hi']})
+    if resume:
+        ckpt.load()
+    else:
+        ckpt.clear()
+        logging.info("Clearing core %s", core)
+        solr.delete_by_query('*:*', core=core, commit=True)
+
+    if bounds['lo'] is None:
+        logging.info("Nothing to index")
+        chunks = []
+    else:
+        chunks = range(bounds['lo'], bounds['hi'] + 1, chunk_size)
+    pending = [c for c in chunks if c not in ckpt.done]
+    logging.info("Indexing %d of %d chunks into %s", len(pending), len(chunks), core)
+
+    def index_chunk(chunk_start):
+        try:
+            qs = queryset.filter(pk__gte=chunk_start,
+                    pk__lt=chunk_start + chunk_size).order_by('pk')
+            batch = []
+            sent = 0
+            for obj in qs.iterator():
+                batch.append(transform(obj))
+                if len(batch) >= batch_size:
+                    limiter.wait(len(batch))
+                    solr.add(batch, core=core)
+                    sent += len(batch)
+                    batch = []
+            if batch:
+                limiter.wait(len(batch))
+                solr.add(batch, core=core)
+                sent += len(batch)
+            ckpt.mark(chunk_start)
+            return sent
+        finally:
+            # each worker thread gets its own db connection
+            connection.close()
+
+    started = time()
+    total = 0
+    pool = ThreadPool(workers)
+    try:
+        for n, sent in enumerate(pool.imap_unordered(index_chunk, pending), 1):
+            total += sent
+            print >> output_stream, "%d/%d chunks, %d docs, %.0f docs/sec" % (
+                    n, len(pending), total, total / max(time() - started, 0.001))
+    except:
+        # don't let the queued chunks keep posting to solr
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    logging.debug("Committing %s", core)
+    solr.commit(core=core)
+
+    if swap_core:
+        swap_cores(solr.pool, solr.solr, core_admin, core, swap_core,
+                timeout=solr.timeout_for(core_admin.strip('/').rsplit('/', 1)[-1]))
+    ckpt.clear()
+    logging.info("Search index complete, %d docs in %.1fs", total, time() - started)
+    return total
@@ -4,12 +4,15 @@ import sys
 import os
 import json
 import logging
-from time import sleep
-from requests import Request, Session, get
+from collections import namedtuple
+from time import sleep, time
+from requests import Request, RequestException
+from brushfire.core.driver.solr import SessionPool
 
-rows, cols = os.popen('stty size', 'r').read().split()
-cols = int(cols)
-del rows
+Progress = namedtuple('Progress', 'processed total rate eta elapsed')
+
+# (connect, read) seconds, for requests without a configured timeout
+DEFAULT_TIMEOUT = (5, 60)
 
 def main():
     logging.basicConfig(level=logging.DEBUG)
@@ -24,99 +27,183 @@ def url(*parts):
         return x
     return "/".join([stripslashes(x) for x in parts])
 
-def progbar_update(n, stream):
+def terminal_columns(default=80):
+    try:
+        rows, cols = os.popen('stty size 2>/dev/null', 'r').read().split()
+        return int(cols)
+    except ValueError:
+        return default
+
+def format_progress(p):
+    s = "%d docs" % p.processed
+    if p.total:
+        s += " of ~%d" % p.total
+    if p.rate:
+        s += ", %.0f docs/sec" % p.rate
+    if p.eta is not None:
+        s += ", eta %ds" % p.eta
+    return s + ", elapsed %ds" % p.elapsed
+
+def progbar_update(n, stream, suffix=''):
+    cols = terminal_columns()
     start = " %2d%% [" % (n * 100)
-    end =  "]\r"
+    end =  "] %s\r" % suffix
     blocks = (cols - (len(start) + len(end) - 1))
     mid = "=" * (int(blocks * n) - 1)
     stream.write(start + mid + ">" + " " * (blocks - (len(mid)+1)) + end)
     stream.flush()
 
-def reindex(host, handler, core, swap_core, core_admin='admin/cores', output_stream=sys.stderr):
+class ProgressReporter(object):
+    """
+    Default progress callback. Draws a progress bar when writing to a TTY and
+    prints one line per update otherwise (eg. in CI logs).
+    """
+    def __init__(self, stream, tty=None):
+        self.stream = stream
+        if tty is None:
+            tty = getattr(stream, 'isatty', lambda: False)()
+        self.tty = tty
+
+    def __call__(self, progress):
+        if self.tty and progress.total and progress.processed < progress.total:
+            eta = "eta %ds" % progress.eta if progress.eta is not None else ""
+            progbar_update(float(progress.processed) / progress.total,
+                    self.stream, eta)
+        else:
+            print >> self.stream, format_progress(progress)
+
+def swap_cores(pool, host, core_admin, core, other, timeout=DEFAULT_TIMEOUT):
+    logging.debug("Swapping Cores")
+    resp = pool.get(url(host, core_admin), params={
+            'wt': 'json',
+            'action': 'swap',
+            'core': core,
+            'other': other}, timeout=timeout)
+    if resp.status_code != 200:
+        raise Exception("Core Swap Failed!, response code: (%d) with body:\n%s" % (resp.status_code, resp.text))
+
+def reindex(host, handler, core, swap_core, core_admin='admin/cores', output_stream=sys.stderr,
+        pool=None, timeout=None, progress=None, min_interval=1, max_interval=60,
+        timeout_for=None):
+    """
+    Run a DIH full-import on `core`, wait for it to finish, optimize, and
+    optionally swap it with `swap_core`.
+
+    DIH status is polled adaptively: every `min_interval` seconds at first,
+    backing off towards `max_interval` while no documents are being
+    processed, and otherwise often enough to catch completion within about a
+    tenth of the estimated time remaining. Each poll passes a Progress tuple
+    to `progress` (by default a ProgressReporter on output_stream). The
+    import is aborted if it runs longer than `timeout` seconds.
+
+    Every request is bounded by the (connect, read) timeout that
+    `timeout_for(name)` returns, where name is the last part of the handler's
+    path ('optimize' for the optimize request), like Solr.timeout_for().
+    Without it DEFAULT_TIMEOUT is used.
+    """
+    if timeout_for is None:
+        timeout_for = lambda name: DEFAULT_TIMEOUT
+    if pool is None:
+        pool = SessionPool(size=1)
+    if progress is None:
+        progress = ProgressReporter(output_stream)
     try:
         base_url = url(host, core, handler)
         index_req = Request('GET', base_url, params={'wt': 'json', 'command': 'full-import', 'clean':'true'}).prepare()
         test_req = Request('GET', base_url, params={'wt': 'json'}).prepare()
         optimize_req = Request('GET', base_url, params={'wt': 'json', 'optimize': 'true'}).prepare()
+        dih_timeout = timeout_for(handler.strip('/').rsplit('/', 1)[-1])
         
-        numdocs_estimate = 1
-        if swap_core:
-            swap_req = Request('GET', url(host, core_admin), params={
-                    'wt': 'json', 
-                    'action': 'swap', 
-                    'core': core, 
-                    'other': swap_core}
-            ).prepare()
-            try:
-                # use "other" core if we're going to swap
-                numdocs_estimate = get(url(host, swap_core, 'select'), 
-                        params={'wt': 'json', 'rows': '0', 'q': '*:*'}).json()['response']['numFound']
-            except:
-                pass
-        else:
-            try:
-                # use index core otherwise
-                numdocs_estimate = get(url(host, core, 'select'), 
-                        params={'wt': 'json', 'rows': '0', 'q': '*:*'}).json()['response']['numFound']
-            except:
-                pass
+        numdocs_estimate = None
+        try:
+            # use "other" core if we're going to swap, index core otherwise
+            numdocs_estimate = pool.get(url(host, swap_core or core, 'select'),
+                    params={'wt': 'json', 'rows': '0', 'q': '*:*'},
+                    timeout=timeout_for('select')).json()['response']['numFound']
+        except:
+            pass
             
         # start index process
         logging.info("Starting search index")
-        try:
-            resp = Session().send(index_req)
-        except Exception as e:
-            logging.exception(e)
-            logging.debug(resp.url)
+        resp = pool.send(index_req, timeout=dih_timeout)
         if resp.status_code != 200:
             raise Exception("%s\n\nIndexing Failed!, response code: (%d) with body:\n%s" % (resp.url, resp.status_code, resp.text))
 
-        # poll every minute until Indexing Complete or error
-        test_session = Session()
+        started = last_time = time()
+        last_done = 0
+        rate = None
+        interval = min_interval
         while True:
-            sleep(60)
-            resp = test_session.send(test_req)
+            sleep(interval)
+            now = time()
+            if timeout and now - started > timeout:
+                pool.get(base_url, params={'wt': 'json', 'command': 'abort'},
+                        timeout=dih_timeout)
+                raise Exception("Indexing timed out after %ds" % (now - started))
+
             logging.debug("Testing DIH for completion...")
+            try:
+                resp = pool.send(test_req, timeout=dih_timeout)
+            except RequestException as e:
+                # a hung status request is retried; `timeout` still applies
+                logging.warning("Solr DIH status request failed: %s", e)
+                interval = min(interval * 2, max_interval)
+                continue
             if resp.status_code != 200:
                 logging.warning("Solr DIH failed!, response code: (%d) with body:\n%s" % (resp.status_code, resp.text))
+                interval = min(interval * 2, max_interval)
                 continue
             
             data = resp.json()
+            messages = data.get('statusMessages', {})
+            done = int(messages.get('Total Documents Processed', last_done))
             
             if data['status'] == 'busy':
-                done = int(data['statusMessages']['Total Documents Processed'])
-                if done > 0 and done < numdocs_estimate:
-                    progbar_update(float(done) / numdocs_estimate, output_stream) 
-                elif done > 0:
-                    print >> output_stream, "%d docs completed" % done
+                if done > last_done:
+                    current = (done - last_done) / (now - last_time)
+                    rate = current if rate is None else 0.7 * rate + 0.3 * current
+                    last_done, last_time = done, now
+                    # moving again, go back to polling often
+                    interval = min_interval
+                else:
+                    interval = min(interval * 2, max_interval)
+                eta = None
+                if rate and numdocs_estimate and numdocs_estimate > done:
+                    eta = (numdocs_estimate - done) / rate
+                    interval = max(min_interval, min(eta / 10, max_interval))
+                progress(Progress(done, numdocs_estimate, rate, eta, now - started))
                 continue
 
-            if data['statusMessages'][''].startswith('Indexing completed'):
+            message = messages.get('', '')
+            if message.startswith('Indexing completed'):
+                progress(Progress(done, numdocs_estimate, rate, 0, now - started))
                 logging.debug("...DIH complete")
                 break
 
-            if data['status'] not in ('idle', 'busy'):
+            if data['status'] not in ('idle', 'busy') or 'failed' in message.lower() \
+                    or 'aborted' in message.lower():
                 logging.debug("Indexing Failed!")
                 raise Exception("Indexing Failed!, response code: (%d) with body:\n%s" % (resp.status_code, resp.text))
 
         # optimize index
         logging.debug("Optimising Index")
-        resp = Session().send(optimize_req)
+        resp = pool.send(optimize_req, timeout=timeout_for('optimize'))
         if resp.status_code != 200:
             raise Exception("Optimize Failed!, response code: (%d) with body:\n%s" % (resp.status_code, resp.text))
 
         # swap secondary index with main index
-        logging.debug("Swapping Cores")
-        resp = Session().send(swap_req)
-        if resp.status_code != 200:
-            raise Exception("Core Swap Failed!, response code: (%d) with body:\n%s" % (resp.status_code, resp.text))
+        if swap_core:
+            swap_cores(pool, host, core_admin, core, swap_core,
+                    timeout=timeout_for(core_admin.strip('/').rsplit('/', 1)[-1]))
 
-        logging.info("Search index complete")
+        logging.info("Search index complete in %ds", time() - started)
     except KeyboardInterrupt:
         from pprint import pformat as pp
-        print >> output_stream, "\n" + pp(get(base_url, params={'wt': 'json', 'command': 'abort'}).json())
+        print >> output_stream, "\n" + pp(pool.get(base_url, params={'wt': 'json', 'command': 'abort'},
+                timeout=dih_timeout).json())
     except Exception, ex:
         logging.exception(ex)
+        raise
 
 if __name__ == '__main__':
     main()
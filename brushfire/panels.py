@@ -0,0 +1,92 @@
+"""
+A django-debug-toolbar panel listing the solr queries made while handling a
+request, with their phase timings. Enable it with:
+
+    DEBUG_TOOLBAR_PANELS = [
+        ...
+        'brushfire.panels.BrushfirePanel',
+    ]
+"""
+import threading
+
+from django.template import Context, Template
+
+from brushfire.core.exceptions import BrushfireConfigException
+from brushfire.signals import query_finished
+
+try:
+    from debug_toolbar.panels import Panel
+except ImportError:
+    raise BrushfireConfigException("BrushfirePanel requires django-debug-toolbar")
+
+TEMPLATE = Template("""
+<table>
+    <thead>
+        <tr>
+            <th>Query</th>
+            <th>Build (ms)</th>
+            <th>Network (ms)</th>
+            <th>QTime (ms)</th>
+            <th>Decode (ms)</th>
+            <th>Hydrate (ms)</th>
+            <th>Total (ms)</th>
+        </tr>
+    </thead>
+    <tbody>
+    {% for q in queries %}
+        <tr class="{% cycle 'djDebugOdd' 'djDebugEven' %}">
+            <td>
+                <strong>{{ q.model }}</strong>
+                {% for r in q.requests %}
+                <div><code>{{ r.url }}</code>{% if r.cached %} (cached){% endif %}</div>
+                {% endfor %}
+            </td>
+            <td>{{ q.phases.build|floatformat:2 }}</td>
+            <td>{{ q.phases.network|floatformat:2 }}</td>
+            <td>{{ q.phases.qtime }}</td>
+            <td>{{ q.phases.decode|floatformat:2 }}</td>
+            <td>{{ q.phases.hydrate|floatformat:2 }}</td>
+            <td>{{ q.total|floatformat:2 }}</td>
+        </tr>
+    {% endfor %}
+    </tbody>
+</table>
+""")
+
+class BrushfirePanel(Panel):
+    title = 'Solr'
+
+    def __init__(self, *args, **kwargs):
+        super(BrushfirePanel, self).__init__(*args, **kwargs)
+        self._queries = []
+        self._thread = None
+
+    @property
+    def nav_subtitle(self):
+        return "%d queries in %.2fms" % (len(self._queries),
+                sum(q['total'] for q in self._queries))
+
+    def record(self, sender, query, timings, **kwargs):
+        # the receiver is global, only keep this request's queries
+        if threading.current_thread() is not self._thread:
+            return
+        self._queries.append({
+            'model': getattr(sender, '__name__', sender),
+            'phases': dict(timings.phases),
+            'requests': list(timings.requests),
+            'total': timings.total or 0,
+        })
+
+    def enable_instrumentation(self):
+        self._thread = threading.current_thread()
+        query_finished.connect(self.record)
+
+    def disable_instrumentation(self):
+        query_finished.disconnect(self.record)
+
+    def generate_stats(self, request, response):
+        self.record_stats({'queries': self._queries})
+
+    @property
+    def content(self):
+        return TEMPLATE.render(Context(self.get_stats()))
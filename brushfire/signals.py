@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after every query evaluation with the model class as sender, the
+# SolrQuery as `query` and a brushfire.core.timing.QueryTimings as `timings`.
+query_finished = Signal(providing_args=['query', 'timings'])
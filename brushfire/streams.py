@@ -0,0 +1,153 @@
+"""
+Streaming expression builders, composed like brushfire.functions:
+
+    >>> from brushfire import streams as s
+    >>> expr = s.rollup(
+    ...     s.search('people', q='*:*', fl='state,weight_lbs', sort='state asc', qt='/export'),
+    ...     s.count('*'), s.sum('weight_lbs'), over='state')
+    >>> for t in s.run(expr, 'people'):
+    ...     print t['state'], t['count(*)'], t['sum(weight_lbs)']
+
+Positional arguments (collections, sub-expressions, metrics) are used as-is;
+keyword arguments become quoted named parameters.
+"""
+from brushfire.core.settings import configuration as conf
+from brushfire.core.driver import DEFAULT
+
+def _quote(value):
+    if isinstance(value, (list, tuple)):
+        value = ','.join(value)
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    return '"%s"' % unicode(value).replace('"', '\\"')
+
+def expr(name, *args, **params):
+    """
+    Build an arbitrary expression, for functions not listed here
+    """
+    parts = [unicode(x) for x in args]
+    parts += ['%s=%s' % (k, _quote(v)) for k, v in sorted(params.items())]
+    return u'%s(%s)' % (name, ','.join(parts))
+
+def run(expression, collection=DEFAULT):
+    """
+    Send `expression` to the /stream handler of `collection`, returning a
+    lazy iterator over the result tuples
+    """
+    return conf.solr_connection.stream(expression, collection)
+
+# sources
+
+def search(collection, **params):
+    return expr('search', collection, **params)
+
+def facet(collection, *metrics, **params):
+    return expr('facet', collection, *metrics, **params)
+
+def stats(collection, *metrics, **params):
+    return expr('stats', collection, *metrics, **params)
+
+def random(collection, **params):
+    return expr('random', collection, **params)
+
+def topic(checkpoint_collection, collection, **params):
+    return expr('topic', checkpoint_collection, collection, **params)
+
+# decorators
+
+def rollup(stream, *metrics, **params):
+    return expr('rollup', stream, *metrics, **params)
+
+def innerJoin(left, right, on):
+    return expr('innerJoin', left, right, on=on)
+
+def leftOuterJoin(left, right, on):
+    return expr('leftOuterJoin', left, right, on=on)
+
+def hashJoin(left, hashed, on):
+    return expr('hashJoin', left, 'hashed=%s' % hashed, on=on)
+
+def outerHashJoin(left, hashed, on):
+    return expr('outerHashJoin', left, 'hashed=%s' % hashed, on=on)
+
+def merge(*streams, **params):
+    return expr('merge', *streams, **params)
+
+def intersect(left, right, on):
+    return expr('intersect', left, right, on=on)
+
+def complement(left, right, on):
+    return expr('complement', left, right, on=on)
+
+def top(stream, n, sort):
+    return expr('top', stream, n=n, sort=sort)
+
+def unique(stream, over):
+    return expr('unique', stream, over=over)
+
+def sort(stream, by):
+    return expr('sort', stream, by=by)
+
+def reduce(stream, by, operation):
+    return expr('reduce', stream, operation, by=by)
+
+def group(sort, n):
+    return expr('group', sort=sort, n=n)
+
+def select(stream, *fields):
+    return expr('select', stream, *fields)
+
+def having(stream, condition):
+    return expr('having', stream, condition)
+
+def parallel(collection, stream, workers, sort, **params):
+    return expr('parallel', collection, stream, workers=workers, sort=sort, **params)
+
+def update(collection, stream, batch_size=500):
+    return expr('update', collection, stream, batchSize=batch_size)
+
+def commit(collection, stream):
+    return expr('commit', collection, stream)
+
+# metrics
+
+def count(field='*'):
+    return 'count(%s)' % field
+
+def sum(field):
+    return 'sum(%s)' % field
+
+def avg(field):
+    return 'avg(%s)' % field
+
+def min(field):
+    return 'min(%s)' % field
+
+def max(field):
+    return 'max(%s)' % field
+
+# boolean operations for having()
+
+def eq(field, value):
+    return 'eq(%s,%s)' % (field, value)
+
+def gt(field, value):
+    return 'gt(%s,%s)' % (field, value)
+
+def gteq(field, value):
+    return 'gteq(%s,%s)' % (field, value)
+
+def lt(field, value):
+    return 'lt(%s,%s)' % (field, value)
+
+def lteq(field, value):
+    return 'lteq(%s,%s)' % (field, value)
+
+def _and(x, y):
+    return 'and(%s,%s)' % (x, y)
+
+def _or(x, y):
+    return 'or(%s,%s)' % (x, y)
+
+def _not(x):
+    return 'not(%s)' % x
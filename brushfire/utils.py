@@ -1,3 +1,5 @@
+import datetime
+
 def quote_string(word, quote_char='"'):
     return '%s%s%s' % (quote_char, word.replace('%s' % quote_char,  r'\%s' % quote_char), quote_char)
 
@@ -7,3 +9,32 @@ def smart_quote_string(word):
         return word
     else:
         return quote_string(word)
+
+def import_class(path):
+    from django.utils.importlib import import_module
+    modulestring, classname = path.rsplit('.', 1)
+    return getattr(import_module(modulestring), classname)
+
+def format_solr_date(value):
+    """
+    Format a date or datetime the way Solr expects it: UTC, ISO-8601, with a
+    trailing Z
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(utc).replace(tzinfo=None)
+        return value.strftime('%Y-%m-%dT%H:%M:%S') + \
+                ('.%03dZ' % (value.microsecond / 1000) if value.microsecond else 'Z')
+    return value.strftime('%Y-%m-%dT00:00:00Z')
+
+class _UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+utc = _UTC()
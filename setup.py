@@ -16,6 +16,11 @@ setup(
         'requests >= 2.2.1',
         'six >= 1.10.0',
     ],
+    extras_require={
+        'async': ['futures >= 3.0.0'],
+        'streaming': ['ijson >= 2.3'],
+        'fastjson': ['ujson >= 1.35'],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Framework :: Django",
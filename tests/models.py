@@ -0,0 +1,9 @@
+from brushfire.core import models as bfm
+
+class Person(bfm.BrushfireModel):
+    ssn = bfm.CharField(primary_key=True)
+    name = bfm.CharField()
+    age = bfm.IntegerField()
+
+    class Meta:
+        app_label = 'tests'
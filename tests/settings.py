@@ -0,0 +1,13 @@
+SECRET_KEY = 'brushfire-tests'
+
+INSTALLED_APPS = []
+
+BRUSHFIRE = {
+    'host': 'http://localhost:8983/solr',
+    'cores': {
+        'query': 'collection1',
+    },
+    'handlers': {
+        'default': 'select',
+    },
+}
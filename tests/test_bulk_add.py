@@ -0,0 +1,54 @@
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from brushfire.core import query
+from brushfire.core.settings import configuration as conf
+from tests.models import Person
+
+class RecordingSolr(object):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.docs = []
+
+    def add(self, docs, core, commit_within=None):
+        if self.fail:
+            raise IOError("solr went away")
+        self.docs.extend(d['ssn'] for d in docs)
+
+class JoinedPool(ThreadPool):
+    pools = []
+
+    def __init__(self, *args, **kwargs):
+        ThreadPool.__init__(self, *args, **kwargs)
+        self.joined = False
+        self.pools.append(self)
+
+    def join(self):
+        ThreadPool.join(self)
+        self.joined = True
+
+class BulkAddTest(unittest.TestCase):
+    def setUp(self):
+        self.solr_connection = getattr(conf, 'solr_connection', None)
+        JoinedPool.pools = []
+        query.ThreadPool = JoinedPool
+
+    def tearDown(self):
+        query.ThreadPool = ThreadPool
+        conf.solr_connection = self.solr_connection
+
+    def people(self, n):
+        return [Person(ssn=str(i), name='p%d' % i, age=i) for i in range(n)]
+
+    def test_workers_are_joined(self):
+        conf.solr_connection = solr = RecordingSolr()
+        sent = Person.objects.bulk_add(self.people(10), batch_size=3, workers=2)
+        self.assertEqual(sent, 10)
+        self.assertEqual(sorted(solr.docs, key=int), [str(i) for i in range(10)])
+        self.assertTrue(JoinedPool.pools[0].joined)
+
+    def test_workers_are_joined_on_error(self):
+        conf.solr_connection = RecordingSolr(fail=True)
+        self.assertRaises(IOError, Person.objects.bulk_add, self.people(10),
+                batch_size=3, workers=2)
+        self.assertTrue(JoinedPool.pools[0].joined)
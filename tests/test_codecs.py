@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from brushfire.core.driver.codecs import JavabinCodec, JSONCodec, get_codec
+from brushfire.core.driver.solr import Solr
+from tests.utils import FakePool
+
+# /select?q=*:*&facet.field=loc&wt=javabin as solr writes it: the response is
+# a SimpleOrderedMap (ORDERED_MAP), names are extern strings, small ints are
+# SINT except 0 (INT), numFound/start are SLONG and the facet counts are a
+# plain NamedList (NAMED_LST)
+SELECT_JAVABIN = ''.join([
+    '\x02',                                     # version
+    '\xa3',                                     # ORDERED_MAP, 3 entries
+    '\xe0\x2eresponseHeader', '\xa3',
+        '\xe0\x26status', '\x06\x00\x00\x00\x00',
+        '\xe0\x25QTime', '\x42',
+        '\xe0\x26params', '\xa3',
+            '\xe0\x21q', '\x23*:*',
+            '\xe0\x2bfacet.field', '\x23loc',
+            '\xe0\x22wt', '\x27javabin',
+    '\xe0\x28response', '\x0c',                 # SOLRDOCLST
+        '\x83', '\x79\x01', '\x60', '\x08\x3f\x5d\xb3\xd7',
+        '\x82',
+        '\x0b\xa5',                             # SOLRDOC, 5 fields
+            '\xe0\x22id', '\x211',
+            '\xe0\x23age', '\x5e\x01',
+            '\xe0\x24born', '\x09\x00\x00\x01\x44\xf1\x9b\xca\xf8',
+            '\xe0\x24tags', '\x82\x21a\x21b',
+            '\xe0\x25score', '\x08\x3f\x5d\xb3\xd7',
+        '\x0b\xa5',
+            '\xe9', '\x212',                    # extern string 9: id
+            '\xea', '\x06\x00\x00\x00\x00',
+            '\xeb', '\x09\x00\x00\x00\xdc\x6a\xcf\xac\x00',
+            '\xec', '\x81\x21c',
+            '\xed', '\x08\x3f\x00\x00\x00',
+    '\xe0\x2cfacet_counts', '\xa3',
+        '\xe0\x2dfacet_queries', '\xa0',
+        '\xe0\x2cfacet_fields', '\xa1',
+            '\xe0\x23loc', '\xc2',
+                '\xe0\x23nyc', '\x54\x01',
+                '\xe0\x22sf', '\x45',
+        '\xe0\x2cfacet_ranges', '\xa0',
+])
+
+# the same response from the JSON response writer
+SELECT_JSON = """{
+  "responseHeader":{"status":0,"QTime":2,
+    "params":{"q":"*:*","facet.field":"loc","wt":"javabin"}},
+  "response":{"numFound":25,"start":0,"maxScore":0.8660254,"docs":[
+      {"id":"1","age":30,"born":"2014-03-24T01:02:03Z","tags":["a","b"],"score":0.8660254},
+      {"id":"2","age":0,"born":"2000-01-01T00:00:00Z","tags":["c"],"score":0.5}]},
+  "facet_counts":{"facet_queries":{},
+    "facet_fields":{"loc":["nyc",20,"sf",5]},
+    "facet_ranges":{}}}"""
+
+class JavabinCodecTest(unittest.TestCase):
+    def test_select_response(self):
+        self.assertEqual(JavabinCodec().decode(SELECT_JAVABIN), json.loads(SELECT_JSON))
+
+    def test_named_list_response(self):
+        # solr before SimpleOrderedMap responses
+        content = '\x02\xc1\xe0\x2eresponseHeader\xa1\xe0\x26status\x06\x00\x00\x00\x00'
+        self.assertEqual(JavabinCodec().decode(content), {'responseHeader': {'status': 0}})
+
+    def test_corrupt_response(self):
+        self.assertRaises(ValueError, JavabinCodec().decode, SELECT_JAVABIN[:100])
+        self.assertRaises(ValueError, JavabinCodec().decode, SELECT_JSON)
+
+class JSONCodecTest(unittest.TestCase):
+    def test_backends(self):
+        self.assertEqual(JSONCodec('json').decode(SELECT_JSON), json.loads(SELECT_JSON))
+        self.assertRaises(ValueError, JSONCodec, 'yaml')
+
+    def test_get_codec(self):
+        self.assertEqual(get_codec('javabin').wt, 'javabin')
+        self.assertEqual(get_codec('json', backend='json').wt, 'json')
+
+class SearchCodecTest(unittest.TestCase):
+    def solr(self, *responses):
+        return Solr('http://localhost:8983/solr', core='collection1',
+                pool=FakePool(*responses), codec=JavabinCodec())
+
+    def test_search_uses_codec(self):
+        solr = self.solr(SELECT_JAVABIN)
+        self.assertEqual(solr.search('*:*'), json.loads(SELECT_JSON))
+        self.assertEqual(solr.pool.requests[0][1]['wt'], 'javabin')
+
+    def test_raw_search_is_json(self):
+        solr = self.solr(SELECT_JSON)
+        self.assertEqual(solr.search('*:*', raw=True), SELECT_JSON)
+        self.assertEqual(solr.pool.requests[0][1]['wt'], 'json')
@@ -0,0 +1,13 @@
+import unittest
+
+from brushfire.core.exceptions import BrushfireConfigException
+from brushfire.core.settings import Configuration
+from brushfire.management.commands.solrindex import Command
+
+class SolrIndexOrmTest(unittest.TestCase):
+    def test_core_required(self):
+        conf = Configuration({
+            'host': 'http://localhost:8983/solr',
+            'index': {'method': 'orm', 'orm': {'queryset': 'tests.models.Person'}},
+        })
+        self.assertRaises(BrushfireConfigException, Command().handle_orm, conf, False)
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from time import sleep
+from StringIO import StringIO
+
+from brushfire.core.exceptions import BrushfireException
+from brushfire.management.utils import ormindex
+
+class FakeQuerySet(object):
+    def __init__(self, pks):
+        self.pks = pks
+
+    def aggregate(self, **kwargs):
+        return {'lo': min(self.pks), 'hi': max(self.pks)}
+
+    def filter(self, pk__gte, pk__lt):
+        return FakeQuerySet([pk for pk in self.pks if pk__gte <= pk < pk__lt])
+
+    def order_by(self, *fields):
+        return self
+
+    def iterator(self):
+        return iter(self.pks)
+
+class FailingSolr(object):
+    """
+    Fails the first add, then takes a while over every other one
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.adds = 0
+
+    def delete_by_query(self, query, core, commit=False):
+        pass
+
+    def add(self, docs, core):
+        with self.lock:
+            self.adds += 1
+            first = self.adds == 1
+        if first:
+            raise IOError("solr went away")
+        sleep(0.01)
+
+class ReindexFailureTest(unittest.TestCase):
+    def test_worker_error_stops_the_pool(self):
+        solr = FailingSolr()
+        self.assertRaises(IOError, ormindex.reindex, solr, FakeQuerySet(range(100)),
+                None, 'collection2', transform=lambda pk: {'id': pk},
+                chunk_size=1, workers=2, output_stream=StringIO())
+        adds = solr.adds
+        sleep(0.2)
+        # nothing was left running in the background
+        self.assertEqual(solr.adds, adds)
+        self.assertTrue(adds < 100)
+
+class RecordingSolr(object):
+    def __init__(self):
+        self.docs = []
+
+    def delete_by_query(self, query, core, commit=False):
+        pass
+
+    def add(self, docs, core):
+        self.docs.extend(d['id'] for d in docs)
+
+    def commit(self, core):
+        pass
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reindex(self, solr, pks, **kwargs):
+        return ormindex.reindex(solr, FakeQuerySet(pks), None, 'collection2',
+                transform=lambda pk: {'id': pk}, workers=1, checkpoint=self.path,
+                output_stream=StringIO(), **kwargs)
+
+    def write_checkpoint(self, chunk_size, lo, hi, done):
+        ckpt = ormindex.Checkpoint(self.path, 'collection2',
+                layout={'chunk_size': chunk_size, 'lo': lo, 'hi': hi})
+        for chunk_start in done:
+            ckpt.mark(chunk_start)
+
+    def test_resume_skips_done_chunks(self):
+        self.write_checkpoint(10, 0, 39, [0, 10])
+        solr = RecordingSolr()
+        self.reindex(solr, range(40), chunk_size=10, resume=True)
+        self.assertEqual(sorted(solr.docs), range(20, 40))
+
+    def test_resume_with_other_chunk_size(self):
+        self.write_checkpoint(10, 0, 39, [0, 20])
+        self.assertRaises(BrushfireException, self.reindex, RecordingSolr(),
+                range(40), chunk_size=20, resume=True)
+
+    def test_resume_with_other_bounds(self):
+        self.write_checkpoint(10, 0, 39, [0])
+        self.assertRaises(BrushfireException, self.reindex, RecordingSolr(),
+                range(5, 40), chunk_size=10, resume=True)
+
+    def test_non_integer_pks(self):
+        solr = RecordingSolr()
+        self.assertRaises(BrushfireException, self.reindex, solr, ['a', 'b'])
+        self.assertEqual(solr.docs, [])
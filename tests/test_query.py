@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+from brushfire.core.driver import _fragment_cache
+from brushfire.core.exceptions import BrushfireException
+from brushfire.core.query import BrushfireQuerySet
+from brushfire.core.types import P
+from tests.models import Person
+
+class SearchFilterTest(unittest.TestCase):
+    def test_filter_keeps_search_text(self):
+        qs = Person.objects.search('foo bar').filter(name='x')
+        self.assertEqual(qs.query.get_querystring(), '((foo bar) AND name:x)')
+
+    def test_search_alone(self):
+        qs = Person.objects.search('foo bar')
+        self.assertEqual(qs.query.get_querystring(), 'foo bar')
+
+    def test_search_is_not_shared(self):
+        base = Person.objects.search('foo bar')
+        base.filter(name='x')
+        self.assertEqual(base.query.get_querystring(), 'foo bar')
+
+class PreparedRangeTest(unittest.TestCase):
+    def test_whole_range_placeholder(self):
+        qs = Person.objects.filter(age__range=P('r'))
+        self.assertRaises(BrushfireException, qs.prepare)
+
+    def test_range_placeholder_pair(self):
+        prepared = Person.objects.filter(age__range=(P('lo'), P('hi'))).prepare()
+        self.assertEqual(prepared.placeholders, set(['lo', 'hi']))
+        query = prepared.bind(lo=30, hi=40).query
+        self.assertEqual(query.get_querystring(), 'age:["${bfp_lo}" TO "${bfp_hi}"]')
+        self.assertEqual(query.bindings, {'bfp_lo': '30', 'bfp_hi': '40'})
+
+class SharedTreeTest(unittest.TestCase):
+    def base(self):
+        return Person.objects.exclude(name='a').exclude(age=3).exclude(ssn='x')
+
+    def test_optimize_leaves_tree_alone(self):
+        where = self.base().query.where
+        children = list(where.children)
+        optimized = where.optimize()
+        self.assertFalse(optimized is where)
+        self.assertEqual(where.children, children)
+
+    def test_concurrent_compiles(self):
+        expected = self.base().query.get_querystring()
+        for clause in ('name', 'age', 'ssn'):
+            self.assertTrue(clause in expected)
+        for _ in range(200):
+            # compile from scratch every time, not from the shared cache
+            _fragment_cache.clear()
+            base = self.base()
+            clones = [base.order_by('age'), base.facet('name'),
+                    base.order_by('-age'), base.facet('age')]
+            results, errors = [], []
+            def compile(qs):
+                try:
+                    results.append(qs.query.get_querystring())
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=compile, args=(qs,)) for qs in clones]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(results, [expected] * 4)
+
+class SerializeTest(unittest.TestCase):
+    def roundtrip(self, qs):
+        return BrushfireQuerySet._from_serial(qs._serialize())
+
+    def test_search_text_survives(self):
+        qs = Person.objects.search('foo bar').filter(age=1)
+        self.assertEqual(qs.query.get_querystring(), '((foo bar) AND age:1)')
+        self.assertEqual(self.roundtrip(qs).query.get_querystring(), '((foo bar) AND age:1)')
+
+class PreparedInTest(unittest.TestCase):
+    def test_placeholder_per_element(self):
+        prepared = Person.objects.filter(name__in=[P('a'), P('b'), 'carl']).prepare()
+        self.assertEqual(prepared.placeholders, set(['a', 'b']))
+        query = prepared.bind(a='Bob Smith', b='Jane').query
+        self.assertEqual(query.get_querystring(), 'name:(${bfp_a} OR ${bfp_b} OR "carl")')
+        self.assertEqual(query.bindings, {'bfp_a': '"Bob Smith"', 'bfp_b': 'Jane'})
+
+    def test_placeholder_bound_to_list(self):
+        query = Person.objects.filter(name__in=P('names')).prepare().bind(
+                names=['Bob', 'Jane']).query
+        self.assertEqual(query.get_querystring(), 'name:(${bfp_names})')
+        self.assertEqual(query.bindings, {'bfp_names': '"Bob" OR "Jane"'})
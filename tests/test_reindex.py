@@ -0,0 +1,58 @@
+import json
+import unittest
+
+from requests import Timeout
+
+from brushfire.management.utils import reindex
+from tests.utils import FakePool
+
+def status(state, done, message=''):
+    return json.dumps({'status': state, 'statusMessages': {
+        'Total Documents Processed': str(done), '': message}})
+
+class ReindexPollingTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = [1000.0]
+        self.sleeps = []
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.clock[0] += seconds
+        self._sleep, self._time = reindex.sleep, reindex.time
+        reindex.sleep = sleep
+        reindex.time = lambda: self.clock[0]
+
+    def tearDown(self):
+        reindex.sleep, reindex.time = self._sleep, self._time
+
+    def test_interval_resets_after_stall(self):
+        pool = FakePool(
+            json.dumps({'response': {'numFound': 0}}), # empty swap core, no estimate
+            '{}', # full-import started
+            status('busy', 0), status('busy', 0), status('busy', 0),
+            status('busy', 100), status('busy', 200),
+            status('idle', 300, 'Indexing completed. Added/Updated: 300 documents.'),
+            '{}', # optimize
+        )
+        progress = []
+        reindex.reindex('http://localhost:8983/solr', 'dataimport', 'collection2', None,
+                pool=pool, progress=progress.append, min_interval=1, max_interval=60)
+        self.assertEqual(self.sleeps, [1, 2, 4, 8, 1, 1])
+        self.assertEqual([p.processed for p in progress], [0, 0, 0, 100, 200, 300])
+
+    def test_requests_are_bounded(self):
+        pool = FakePool(
+            json.dumps({'response': {'numFound': 300}}),
+            '{}',
+            Timeout("status request hung"),
+            status('busy', 100),
+            status('idle', 300, 'Indexing completed. Added/Updated: 300 documents.'),
+            '{}', # optimize
+            '{}', # swap
+        )
+        timeouts = {'dataimport': (1, 10), 'optimize': (1, 3600)}
+        reindex.reindex('http://localhost:8983/solr', '/dataimport', 'collection2',
+                'collection1', pool=pool, progress=lambda p: None,
+                timeout_for=lambda name: timeouts.get(name, (2, 20)))
+        self.assertEqual(pool.timeouts, [(2, 20), (1, 10), (1, 10), (1, 10),
+                (1, 10), (1, 3600), (2, 20)])
+        self.assertEqual(self.sleeps[:2], [1, 2])
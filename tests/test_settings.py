@@ -0,0 +1,30 @@
+import unittest
+
+from brushfire.core.driver.asyncsolr import AsyncSolr, ThreadPoolExecutor
+from brushfire.core.driver.solr import Solr
+from brushfire.core.settings import Configuration
+
+class DriverOptionsTest(unittest.TestCase):
+    def configure(self, driver, **extra):
+        c = {'host': 'http://localhost:8983/solr'}
+        c.update(extra)
+        return Configuration(c).configure_solr(driver)
+
+    @unittest.skipIf(ThreadPoolExecutor is None, "requires futures")
+    def test_async_workers(self):
+        solr = self.configure(AsyncSolr, driver_options={'workers': 50})
+        try:
+            self.assertEqual(solr.executor._max_workers, 50)
+        finally:
+            solr.shutdown()
+
+    @unittest.skipIf(ThreadPoolExecutor is None, "requires futures")
+    def test_async_workers_default(self):
+        solr = self.configure(AsyncSolr, connection={'pool_size': 7})
+        try:
+            self.assertEqual(solr.executor._max_workers, 7)
+        finally:
+            solr.shutdown()
+
+    def test_no_options(self):
+        self.assertIsInstance(self.configure(Solr), Solr)
@@ -0,0 +1,44 @@
+import json
+import shutil
+import tempfile
+import unittest
+
+from brushfire.core.cache import FileQueryCache
+from brushfire.core.driver.solr import Solr
+from tests.utils import FakePool
+
+def response(partial=False):
+    header = {'status': 0, 'QTime': 1}
+    if partial:
+        header['partialResults'] = True
+    return json.dumps({'responseHeader': header,
+        'response': {'numFound': 1, 'start': 0, 'docs': [{'id': '1'}]}})
+
+class PartialResultsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def solr(self, *responses):
+        return Solr('http://localhost:8983/solr', core='collection1',
+                pool=FakePool(*responses), cache=FileQueryCache(self.dir))
+
+    def test_partial_results_not_cached(self):
+        solr = self.solr(response(partial=True), response())
+        self.assertTrue(solr.search('*:*')['responseHeader']['partialResults'])
+        self.assertFalse('partialResults' in solr.search('*:*')['responseHeader'])
+        self.assertEqual(len(solr.pool.requests), 2)
+
+    def test_complete_results_cached(self):
+        solr = self.solr(response())
+        solr.search('*:*')
+        solr.search('*:*')
+        self.assertEqual(len(solr.pool.requests), 1)
+
+    def test_raw_partial_results_not_cached(self):
+        solr = self.solr(response(partial=True), response())
+        solr.search('*:*', raw=True)
+        solr.search('*:*', raw=True)
+        self.assertEqual(len(solr.pool.requests), 2)
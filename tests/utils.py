@@ -0,0 +1,40 @@
+import json
+
+class FakeResponse(object):
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.url = ''
+
+    def json(self):
+        return json.loads(self.content)
+
+class FakePool(object):
+    """
+    Stands in for a SessionPool, answering every request with the next of
+    `responses` (raising it if it is an exception) and recording the
+    parameters and timeout it was sent
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.timeouts = []
+
+    def _next(self, url, params, timeout):
+        self.requests.append((url, dict(params or ())))
+        self.timeouts.append(timeout)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if not isinstance(response, FakeResponse):
+            response = FakeResponse(response)
+        return response
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        return self._next(url, params, timeout)
+
+    def post(self, url, data=None, timeout=None, **kwargs):
+        return self._next(url, data, timeout)
+
+    def send(self, request, timeout=None, **kwargs):
+        return self._next(request.url, None, timeout)